@@ -1,27 +1,184 @@
 # LyvionTube.py - Archivo principal de la aplicación Flask para LyvionTube
-# Código completo y funcional. Instala dependencias con: pip install flask flask-sqlalchemy werkzeug stripe
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_from_directory, g
+# Código completo y funcional. Instala dependencias con: pip install flask flask-sqlalchemy werkzeug stripe gunicorn
+from flask import Flask, Response, abort, render_template, request, redirect, url_for, flash, session, g, has_request_context
+from flask import before_render_template, template_rendered
+from flask.cli import FlaskGroup
+from markupsafe import Markup
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event, inspect, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import contains_eager, joinedload
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.sql.elements import TextClause
+from werkzeug.http import http_date
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
 from werkzeug.utils import secure_filename
 import os
-from datetime import datetime, timedelta
+import atexit
+import base64
+import bisect
+import contextlib
+import csv
+import fcntl
+import functools
+import hashlib
+import io
+import json
+import math
+import mimetypes
+import mmap
+import re
+import shutil
+import random
+import secrets
+import sqlite3
+import stat
+import struct
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone
 import stripe  # Agrega esto para pagos
+import click
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'tu_clave_secreta_aqui'  # Cambia esto en producción
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///lyviontube.db')  # Para Render o local
+app.config['DATABASE_READ_URL'] = os.environ.get('DATABASE_READ_URL')  # Réplica opcional para las rutas de solo lectura
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))  # Conexiones persistentes por proceso (bases con servidor)
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+app.config['DB_POOL_TIMEOUT'] = 10  # Segundos esperando una conexión libre del pool
+app.config['DB_POOL_RECYCLE'] = 1800  # Renovar conexiones antes de que el servidor las cierre por inactividad
+app.config['SQLITE_BUSY_TIMEOUT'] = 5000  # Milisegundos que SQLite espera un bloqueo antes de fallar
+app.config['SQLITE_CACHE_SIZE'] = 64 * 1024  # KiB de caché de páginas por conexión
+app.config['SQLITE_MMAP_SIZE'] = 256 * 1024 * 1024  # Bytes del archivo leídos vía mmap
+app.config['DB_BUSY_RETRIES'] = 5  # Reintentos de una escritura que encontró la base bloqueada
+app.config['DB_READ_AFTER_WRITE'] = 10  # Segundos tras una escritura en los que el usuario lee del principal
 app.config['UPLOAD_FOLDER'] = 'uploads'  # Carpeta para videos y fotos
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB límite para uploads
+app.config['UPLOAD_CHUNK_SIZE'] = 8 * 1024 * 1024  # Trozo máximo por petición en subidas por partes
+app.config['MAX_UPLOAD_SIZE'] = int(os.environ.get('MAX_UPLOAD_SIZE', 4 * 1024 * 1024 * 1024))  # Tamaño máximo de un video subido por partes
+app.config['UPLOAD_SESSION_TTL'] = 24 * 3600  # Segundos sin actividad antes de borrar una subida incompleta
+app.config['MEDIA_MAX_AGE'] = int(os.environ.get('MEDIA_MAX_AGE', 7 * 24 * 3600))  # Cache del navegador para /uploads
+app.config['MEDIA_STAT_TTL'] = 30  # Segundos que se reutiliza el stat de un archivo multimedia
+app.config['MEDIA_STAT_CACHE_SIZE'] = 4096
+app.config['MEDIA_STORAGE'] = os.environ.get('MEDIA_STORAGE', 'local')  # Backend de archivos por contenido (ver STORAGE_BACKENDS)
+app.config['MEDIA_STORAGE_ROOT'] = os.environ.get('MEDIA_STORAGE_ROOT')  # Por defecto <UPLOAD_FOLDER>/blobs
+app.config['BLOB_MAX_AGE'] = 365 * 24 * 3600  # Cache de /media: el contenido de una clave nunca cambia
+app.config['BLOB_GC_GRACE'] = 3600  # Segundos sin referencias antes de borrar un archivo
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))  # Hilos por proceso; 0 = usar "flask run-jobs"
+app.config['JOB_POLL_INTERVAL'] = 2  # Segundos entre consultas a la cola cuando está vacía
+app.config['JOB_MAX_ATTEMPTS'] = 3
+app.config['JOB_RETRY_DELAY'] = 30  # Segundos antes del primer reintento (luego se duplica)
+app.config['JOB_TIMEOUT'] = 30 * 60  # Un trabajo "running" más viejo que esto se considera abandonado
+app.config['USER_CACHE_TTL'] = 60  # Segundos que se reutiliza la foto del usuario actual
+app.config['USER_CACHE_SIZE'] = 10000
+app.config['PAGE_CACHE_ENABLED'] = os.environ.get('PAGE_CACHE_ENABLED', '1') == '1'  # Caché de fragmentos de home, canal y video
+app.config['PAGE_CACHE_MAX_ENTRIES'] = 2000
+app.config['PAGE_CACHE_MAX_BYTES'] = 64 * 1024 * 1024
+app.config['PAGE_CACHE_TTL'] = 60  # Acota lo desactualizado que puede quedar un fragmento en otros procesos
+app.config['FOLLOWER_WRITE_BEHIND'] = os.environ.get('FOLLOWER_WRITE_BEHIND', '0') == '1'  # Agrupar deltas de seguidores en memoria
+app.config['FOLLOWER_FLUSH_INTERVAL'] = 2  # Segundos entre escrituras del búfer de seguidores
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'  # Métricas por petición y /metrics
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')  # Si se define, /metrics exige "Authorization: Bearer <token>"
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR')  # Instantáneas por proceso que /metrics suma; por defecto instance/metrics
+app.config['METRICS_FLUSH_INTERVAL'] = int(os.environ.get('METRICS_FLUSH_INTERVAL', 5))  # Segundos entre volcados de cada worker
+app.config['SLOW_QUERY_MS'] = int(os.environ.get('SLOW_QUERY_MS', 100))  # Sentencias más lentas van al log slow_sql
+app.config['REPEATED_QUERY_THRESHOLD'] = 10  # Misma consulta N veces en una petición: aviso de N+1
+app.config['WEB_WORKERS'] = int(os.environ.get('WEB_CONCURRENCY', 2 * (os.cpu_count() or 1) + 1))  # Procesos de "serve"
+app.config['WEB_THREADS'] = int(os.environ.get('WEB_THREADS', 4))  # Hilos por proceso
+app.config['WORKER_TIMEOUT'] = 120  # Segundos antes de reiniciar un worker bloqueado (subidas lentas incluidas)
+app.config['SHUTDOWN_TIMEOUT'] = 30  # Segundos para terminar peticiones y trabajos en curso al apagar
+app.config['TRENDING_HALF_LIFE'] = 24 * 3600  # Segundos de antigüedad que valen lo mismo que duplicar la interacción
+app.config['TRENDING_REFRESH_INTERVAL'] = int(os.environ.get('TRENDING_REFRESH_INTERVAL', 600))  # Recalculo completo periódico
+app.config['JOB_SCHEDULE_INTERVAL'] = 60  # Segundos entre revisiones de los trabajos periódicos
+app.config['FEED_FANOUT_MAX_FOLLOWERS'] = int(os.environ.get('FEED_FANOUT_MAX_FOLLOWERS', 10000))  # Canales más grandes se leen al vuelo
+app.config['FEED_TIMELINE_LENGTH'] = 500  # Entradas que se conservan en el timeline de cada usuario
+app.config['FEED_BACKFILL'] = 50  # Últimos videos de un canal que se copian al seguirlo
+app.config['FEED_TRIM_INTERVAL'] = 3600  # Segundos entre recortes de los timelines
+app.config['CASCADE_BATCH_SIZE'] = 1000  # Filas por transacción en los borrados en cascada y la recolección de basura
+app.config['GC_INTERVAL'] = int(os.environ.get('GC_INTERVAL', 24 * 3600))  # Segundos entre recolecciones de basura
+app.config['SEARCH_INDEX_TTL'] = int(os.environ.get('SEARCH_INDEX_TTL', 300))  # Índice en memoria: se reconstruye tras N segundos para ver lo escrito por otros procesos
+app.config['PAGE_SIZE'] = int(os.environ.get('PAGE_SIZE', 24))  # Elementos por página en los listados
 app.config['STRIPE_PUBLIC_KEY'] = 'tu_clave_publica_de_stripe'  # Agrega tu clave pública de Stripe
 app.config['STRIPE_SECRET_KEY'] = 'tu_clave_secreta_de_stripe'  # Agrega tu clave secreta de Stripe
 
 stripe.api_key = app.config['STRIPE_SECRET_KEY']  # Configura Stripe
 
-db = SQLAlchemy(app)
+# Motores de base de datos: pool según el tipo de base y un motor opcional de lectura
+def engine_options(url):
+    if url.startswith('sqlite'):
+        # El resto de los ajustes de SQLite se aplican como pragmas en cada conexión nueva
+        return {'connect_args': {'timeout': app.config['SQLITE_BUSY_TIMEOUT'] / 1000}}
+    return {
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+        'pool_recycle': app.config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True
+    }
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+if app.config['DATABASE_READ_URL']:
+    app.config['SQLALCHEMY_BINDS'] = {'read': {'url': app.config['DATABASE_READ_URL'], **engine_options(app.config['DATABASE_READ_URL'])}}
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    # WAL: los lectores no esperan a los escritores; NORMAL es seguro con WAL y evita un fsync por commit
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT']}")
+    cursor.execute(f"PRAGMA cache_size=-{app.config['SQLITE_CACHE_SIZE']}")
+    cursor.execute(f"PRAGMA mmap_size={app.config['SQLITE_MMAP_SIZE']}")
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.close()
+
+def is_read_clause(clause):
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip().upper().startswith('SELECT')
+    return bool(getattr(clause, 'is_select', False)) and getattr(clause, '_for_update_arg', None) is None
 
-# Crear carpeta de uploads si no existe
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+class RoutingSession(FlaskSession):
+    # Las lecturas de rutas de solo lectura van al motor 'read'; escrituras y todo lo demás al principal
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or not is_read_clause(clause):
+                g.db_wrote = True
+            elif g.get('db_read_only') and 'read' in self._db.engines:
+                return self._db.engines['read']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+def is_database_busy(error):
+    message = str(error.orig).lower()
+    return 'locked' in message or 'busy' in message
+
+def retry_on_busy(work):
+    # Una unidad de escritura: work() y su commit. En WAL una transacción que leyó y luego quiere escribir falla
+    # sin esperar si otro escritor confirmó antes; se descarta solo esa transacción y se repite con espera
+    # exponencial, así nunca se vuelve a aplicar algo que ya estaba confirmado
+    @functools.wraps(work)
+    def wrapper(*args, **kwargs):
+        for attempt in range(app.config['DB_BUSY_RETRIES'] + 1):
+            try:
+                result = work(*args, **kwargs)
+                db.session.commit()
+                return result
+            except OperationalError as error:
+                db.session.rollback()
+                if attempt == app.config['DB_BUSY_RETRIES'] or not is_database_busy(error):
+                    raise
+                time.sleep(0.05 * 2 ** attempt * (0.5 + random.random()))
+    return wrapper
 
 # Modelos de base de datos
 class User(db.Model):
@@ -43,9 +200,11 @@ class Channel(db.Model):
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, default='')
     followers = db.Column(db.BigInteger, default=0)  # Cambiado a BigInteger
+    followers_offset = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')  # Seguidores otorgados por el admin
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     videos = db.relationship('Video', backref='channel', lazy=True)
     followed_by = db.relationship('Follow', foreign_keys='Follow.channel_id', backref='followed_channel', lazy=True)
+    __table_args__ = (db.Index('ix_channel_owner_id', 'owner_id'),)
 
 class Video(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -55,7 +214,19 @@ class Video(db.Model):
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)  # Nueva columna para fecha de subida
     uploader_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     channel_id = db.Column(db.Integer, db.ForeignKey('channel.id'), nullable=False)
+    likes = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Contador desnormalizado de likes
+    dislikes = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Contador desnormalizado de dislikes
+    comments_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Contador desnormalizado de comentarios
+    trending_score = db.Column(db.Float, nullable=False, default=0, server_default='0')  # Ver trending_score()
+    duration = db.Column(db.Float, nullable=True)  # Segundos; lo completa el procesamiento en segundo plano
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    checksum = db.Column(db.String(64), nullable=True)  # SHA-256 del archivo ya procesado
     comments = db.relationship('Comment', backref='video', lazy=True)
+    __table_args__ = (db.Index('ix_video_upload_date', 'upload_date', 'id'),
+                      db.Index('ix_video_channel_date', 'channel_id', 'upload_date', 'id'),
+                      db.Index('ix_video_uploader_id', 'uploader_id'),
+                      db.Index('ix_video_trending', 'trending_score', 'id'))
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -63,17 +234,59 @@ class Comment(db.Model):
     video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     user = db.relationship('User', backref='comments')  # Relación con User
+    __table_args__ = (db.Index('ix_comment_video_id', 'video_id'),
+                      db.Index('ix_comment_user_id', 'user_id'))
 
 class Follow(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     channel_id = db.Column(db.Integer, db.ForeignKey('channel.id'), nullable=False)
+    __table_args__ = (db.Index('uq_follow_user_channel', 'user_id', 'channel_id', unique=True),
+                      db.Index('ix_follow_channel_id', 'channel_id'))
 
 class Like(db.Model):  # Nueva tabla para likes/dislikes por usuario
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=False)
     type = db.Column(db.String(10), nullable=False)  # 'like' or 'dislike'
+    __table_args__ = (db.Index('ix_like_video_type', 'video_id', 'type'),
+                      db.Index('ix_like_user_video', 'user_id', 'video_id'))
+
+class Job(db.Model):  # Trabajos en segundo plano (procesamiento de videos, etc.)
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, default='{}')  # JSON
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    __table_args__ = (db.Index('ix_job_status_run_after', 'status', 'run_after'),
+                      db.Index('ix_job_status_started_at', 'status', 'started_at'),
+                      db.Index('ix_job_kind_status', 'kind', 'status', 'finished_at'))
+
+class Blob(db.Model):  # Archivo guardado por contenido; refcount = filas de Video.filename y User.profile_pic que lo usan
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(120), nullable=False)  # ab/cd/<sha256>.<ext>
+    size = db.Column(db.BigInteger, nullable=True)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    released_at = db.Column(db.DateTime, nullable=True)  # Última vez que perdió una referencia
+    __table_args__ = (db.Index('uq_blob_key', 'key', unique=True),
+                      db.Index('ix_blob_refcount_released', 'refcount', 'released_at'))
+
+class TimelineEntry(db.Model):  # Feed de suscripciones precalculado: una fila por (seguidor, video) de canales pequeños
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=False)
+    channel_id = db.Column(db.Integer, db.ForeignKey('channel.id'), nullable=False)
+    upload_date = db.Column(db.DateTime, nullable=False)  # Copia de video.upload_date: clave del cursor sin leer video
+    __table_args__ = (db.Index('uq_timeline_user_video', 'user_id', 'video_id', unique=True),
+                      db.Index('ix_timeline_user_date', 'user_id', 'upload_date', 'video_id'),
+                      db.Index('ix_timeline_video_id', 'video_id'))
 
 # Funciones auxiliares
 def format_followers(num):
@@ -86,6 +299,34 @@ def format_followers(num):
 def allowed_file(filename, extensions=['mp4', 'mp3']):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in extensions
 
+# Caché por proceso del usuario actual: una foto liviana con TTL y LRU, invalidada al modificar el usuario
+UserSnapshot = namedtuple('UserSnapshot', ['id', 'username', 'nickname', 'profile_pic', 'plan', 'plan_expiry', 'is_moderator'])
+user_cache = OrderedDict()  # id -> (expira, UserSnapshot)
+user_cache_lock = threading.Lock()
+
+def get_user_snapshot(user_id):
+    now = time.monotonic()
+    with user_cache_lock:
+        cached = user_cache.get(user_id)
+        if cached and cached[0] > now:
+            user_cache.move_to_end(user_id)
+            return cached[1]
+    row = db.session.query(*[getattr(User, field) for field in UserSnapshot._fields]).filter(User.id == user_id).first()
+    if row is None:
+        return None
+    snapshot = UserSnapshot(*row)
+    with user_cache_lock:
+        user_cache[user_id] = (now + app.config['USER_CACHE_TTL'], snapshot)
+        user_cache.move_to_end(user_id)
+        while len(user_cache) > app.config['USER_CACHE_SIZE']:
+            user_cache.popitem(last=False)
+    return snapshot
+
+def invalidate_user(*user_ids):
+    with user_cache_lock:
+        for user_id in user_ids:
+            user_cache.pop(int(user_id), None)
+
 def has_active_plan(user):
     if user.plan in ['Pro', 'VIP']:
         return True
@@ -93,24 +334,2465 @@ def has_active_plan(user):
         return True
     return False
 
-def get_video_likes(video_id):
-    return Like.query.filter_by(video_id=video_id, type='like').count()
+# Contadores de reacciones: Video.likes y Video.dislikes se mantienen exactos desde video()
+def apply_reaction_delta(video_id, likes=0, dislikes=0):
+    # Incremento atómico en SQL para no perder actualizaciones concurrentes
+    values = {}
+    if likes:
+        values[Video.likes] = Video.likes + likes
+    if dislikes:
+        values[Video.dislikes] = Video.dislikes + dislikes
+    if values:
+        Video.query.filter_by(id=video_id).update(values, synchronize_session=False)
+
+def get_reaction_counts(video_ids):
+    # Cuenta likes y dislikes de muchos videos con una sola consulta agrupada
+    counts = {video_id: (0, 0) for video_id in video_ids}
+    if not counts:
+        return counts
+    rows = db.session.query(Like.video_id, Like.type, db.func.count(Like.id)) \
+        .filter(Like.video_id.in_(list(counts))) \
+        .group_by(Like.video_id, Like.type).all()
+    for video_id, like_type, total in rows:
+        likes, dislikes = counts[video_id]
+        if like_type == 'like':
+            likes = total
+        elif like_type == 'dislike':
+            dislikes = total
+        counts[video_id] = (likes, dislikes)
+    return counts
+
+def reconcile_reaction_counters(batch_size=500):
+    # Reconstruye los contadores desde la tabla Like; devuelve cuántos videos se corrigieron
+    fixed = 0
+    last_id = 0
+    while True:
+        batch = db.session.query(Video.id, Video.likes, Video.dislikes) \
+            .filter(Video.id > last_id).order_by(Video.id).limit(batch_size).all()
+        if not batch:
+            break
+        counts = get_reaction_counts([row.id for row in batch])
+        updates = [{'id': row.id, 'likes': counts[row.id][0], 'dislikes': counts[row.id][1]}
+                   for row in batch if (row.likes, row.dislikes) != counts[row.id]]
+        if updates:
+            db.session.bulk_update_mappings(Video, updates)
+            db.session.commit()
+            fixed += len(updates)
+        last_id = batch[-1].id
+    return fixed
+
+# Tendencias: score materializado en Video.trending_score (índice ix_video_trending), la portada es una lectura indexada
+TRENDING_EPOCH = datetime(2025, 1, 1)
+TRENDING_WEIGHTS = {'likes': 1.0, 'dislikes': -1.0, 'comments': 2.0}
+
+def trending_score(likes, dislikes, comments, upload_date):
+    # log10 de la interacción + antigüedad lineal: equivale a interacción * 2^(t / vida media), así que el score
+    # de un video no envejece y solo cambia cuando cambian sus contadores
+    engagement = (likes * TRENDING_WEIGHTS['likes'] + dislikes * TRENDING_WEIGHTS['dislikes']
+                  + comments * TRENDING_WEIGHTS['comments'])
+    sign = 1 if engagement > 0 else -1 if engagement < 0 else 0
+    recency = ((upload_date or datetime.utcnow()) - TRENDING_EPOCH).total_seconds() / app.config['TRENDING_HALF_LIFE']
+    return round(sign * math.log10(max(abs(engagement), 1)) + recency * math.log10(2), 7)
+
+def apply_comment_delta(video_id, delta):
+    Video.query.filter_by(id=video_id).update({Video.comments_count: Video.comments_count + delta}, synchronize_session=False)
+
+def refresh_trending_score(video):
+    # Tras confirmar una reacción o comentario: los contadores del objeto ya vienen recargados del commit
+    score = trending_score(video.likes, video.dislikes, video.comments_count, video.upload_date)
+    Video.query.filter_by(id=video.id).update({Video.trending_score: score}, synchronize_session=False)
+
+@event.listens_for(Video, 'before_insert')
+def set_initial_trending_score(mapper, connection, target):
+    target.trending_score = trending_score(target.likes or 0, target.dislikes or 0, target.comments_count or 0, target.upload_date)
+
+def recompute_trending(conn, batch_size=1000):
+    # Recalculo completo por lotes: recuenta comentarios y reescribe los scores que cambiaron; devuelve cuántos
+    video = Video.__table__
+    update = video.update().where(video.c.id == db.bindparam('row_id')).values(
+        comments_count=db.bindparam('new_comments'), trending_score=db.bindparam('new_score'))
+    changed = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(db.select(video.c.id, video.c.likes, video.c.dislikes, video.c.comments_count,
+                                      video.c.trending_score, video.c.upload_date)
+                            .where(video.c.id > last_id).order_by(video.c.id).limit(batch_size)).all()
+        if not rows:
+            break
+        comments = dict(conn.execute(db.select(Comment.video_id, db.func.count(Comment.id))
+                                     .where(Comment.video_id.between(rows[0].id, rows[-1].id)).group_by(Comment.video_id)).all())
+        updates = []
+        for row in rows:
+            count = comments.get(row.id, 0)
+            score = trending_score(row.likes, row.dislikes, count, row.upload_date)
+            if count != row.comments_count or abs(score - row.trending_score) > 1e-6:
+                updates.append({'row_id': row.id, 'new_comments': count, 'new_score': score})
+        if updates:
+            conn.execute(update, updates)
+            changed += len(updates)
+        last_id = rows[-1].id
+    return changed
+
+# Paginación por cursor (keyset): los videos se ordenan por (upload_date, id) y usuarios/canales por id
+def encode_cursor(*values):
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, length=1):
+    # Devuelve la lista de length valores del cursor o None si no hay cursor o es inválido (otro JSON, otro largo)
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        return None
+    return values if isinstance(values, list) and len(values) == length else None
+
+def page_limit():
+    try:
+        limit = int(request.args.get('limit', app.config['PAGE_SIZE']))
+    except ValueError:
+        limit = app.config['PAGE_SIZE']
+    return max(1, min(limit, 100))
+
+VIDEO_ORDERS = {
+    # orden -> (columna de la clave, cómo leer el valor del cursor)
+    'recent': (Video.upload_date, datetime.fromisoformat),
+    'trending': (Video.trending_score, float)
+}
+
+def paginate_videos(query, cursor=None, limit=None, query_only=False, order='recent'):
+    # Videos más recientes (o con más tendencia) primero; devuelve (videos, siguiente_cursor) o solo la consulta
+    limit = limit or page_limit()
+    column, parse = VIDEO_ORDERS[order]
+    values = decode_cursor(cursor, 2)
+    if values:
+        try:
+            key, last_id = parse(values[0]), int(values[1])
+        except (TypeError, ValueError, IndexError):
+            key = None
+        if key is not None:
+            query = query.filter((column < key) | ((column == key) & (Video.id < last_id)))
+    query = query.order_by(column.desc(), Video.id.desc()).limit(limit + 1)
+    if query_only:
+        return query
+    videos = query.all()
+    next_cursor = None
+    if len(videos) > limit:
+        videos = videos[:limit]
+        next_cursor = encode_cursor(getattr(videos[-1], column.key), videos[-1].id)
+    return videos, next_cursor
+
+def paginate_by_id(query, model, cursor=None, limit=None):
+    # Orden ascendente por id; devuelve (filas, siguiente_cursor)
+    limit = limit or page_limit()
+    values = decode_cursor(cursor)
+    if values:
+        try:
+            query = query.filter(model.id > int(values[0]))
+        except (TypeError, ValueError, IndexError):
+            pass
+    rows = query.order_by(model.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].id)
+    return rows, next_cursor
+
+def paginate_comments(video_id, cursor=None, limit=None):
+    # Comentarios más nuevos primero con el autor en la misma consulta; devuelve (comentarios, siguiente_cursor)
+    limit = limit or page_limit()
+    # JOIN interno: los comentarios de un usuario ya borrado (pendientes de cascade_delete) no se muestran
+    query = Comment.query.join(Comment.user).options(contains_eager(Comment.user)).filter(Comment.video_id == video_id)
+    values = decode_cursor(cursor)
+    if values:
+        try:
+            query = query.filter(Comment.id < int(values[0]))
+        except (TypeError, ValueError, IndexError):
+            pass
+    comments = query.order_by(Comment.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(comments) > limit:
+        comments = comments[:limit]
+        next_cursor = encode_cursor(comments[-1].id)
+    return comments, next_cursor
+
+def comment_to_dict(comment, user=None):
+    user = user or comment.user  # El autor ya cargado (o la foto del usuario actual) evita otra consulta
+    return {
+        'id': comment.id,
+        'content': comment.content,
+        'video_id': comment.video_id,
+        'user_id': comment.user_id,
+        'user_nickname': user.nickname if user else None
+    }
+
+def video_to_dict(video):
+    return {
+        'id': video.id,
+        'title': video.title,
+        'description': video.description,
+        'url': url_for('video', video_id=video.id),
+        'file_url': media_url(video.filename),
+        'upload_date': video.upload_date.isoformat() if video.upload_date else None,
+        'channel_id': video.channel_id,
+        'likes': video.likes,
+        'dislikes': video.dislikes,
+        'comments': video.comments_count,
+        'trending_score': video.trending_score
+    }
+
+def channel_to_dict(channel):
+    return {
+        'id': channel.id,
+        'name': channel.name,
+        'description': channel.description,
+        'url': url_for('channel', channel_id=channel.id),
+        'followers': channel_followers(channel),
+        'owner_id': channel.owner_id
+    }
+
+def user_to_dict(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'nickname': user.nickname,
+        'plan': user.plan,
+        'is_moderator': user.is_moderator
+    }
+
+def is_admin():
+    return bool(g.current_user and g.current_user.username == 'LyvionStudio')
+
+# Índice de búsqueda: FTS5 en SQLite y un índice invertido en memoria para otros motores
+def normalize_search_text(value):
+    # Minúsculas y sin acentos para que "canción" coincida con "cancion"
+    decomposed = unicodedata.normalize('NFKD', (value or '').lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+def tokenize_search_text(value):
+    return re.findall(r'\w+', normalize_search_text(value))
+
+# Campos indexados por tipo de documento y su peso en el ranking (el título pesa más)
+SEARCH_FIELDS = {
+    'video': (Video, (('title', 3.0), ('description', 1.0))),
+    'channel': (Channel, (('name', 3.0), ('description', 1.0)))
+}
+
+class FTS5SearchIndex:
+    name = 'fts5'
+
+    def install(self):
+        # Tablas virtuales sin contenido propio y triggers que las mantienen al día en insert/update/delete
+        with db.engine.begin() as conn:
+            existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+            for kind, (model, fields) in SEARCH_FIELDS.items():
+                table = model.__tablename__
+                columns = ', '.join(field for field, _ in fields)
+                new_values = ', '.join(f"coalesce(new.{field}, '')" for field, _ in fields)
+                conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {kind}_fts USING fts5({columns}, tokenize = 'unicode61 remove_diacritics 2')"))
+                conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {kind}_fts_ai AFTER INSERT ON {table} BEGIN "
+                                  f"INSERT INTO {kind}_fts(rowid, {columns}) VALUES (new.id, {new_values}); END"))
+                conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {kind}_fts_ad AFTER DELETE ON {table} BEGIN "
+                                  f"DELETE FROM {kind}_fts WHERE rowid = old.id; END"))
+                conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {kind}_fts_au AFTER UPDATE OF {columns} ON {table} BEGIN "
+                                  f"DELETE FROM {kind}_fts WHERE rowid = old.id; "
+                                  f"INSERT INTO {kind}_fts(rowid, {columns}) VALUES (new.id, {new_values}); END"))
+        # Si las tablas virtuales son nuevas hay que indexar los datos que ya existían
+        return any(f'{kind}_fts' not in existing for kind in SEARCH_FIELDS)
+
+    def rebuild(self):
+        with db.engine.begin() as conn:
+            for kind, (model, fields) in SEARCH_FIELDS.items():
+                columns = ', '.join(field for field, _ in fields)
+                values = ', '.join(f"coalesce({field}, '')" for field, _ in fields)
+                conn.execute(text(f"DELETE FROM {kind}_fts"))
+                conn.execute(text(f"INSERT INTO {kind}_fts(rowid, {columns}) SELECT id, {values} FROM {model.__tablename__}"))
+
+    def search(self, kind, query, limit, offset=0):
+        terms = tokenize_search_text(query)
+        if not terms:
+            return []
+        # Cada término se busca como prefijo y todos deben aparecer; bm25 ordena de más a menos relevante
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(weight) for _, weight in SEARCH_FIELDS[kind][1])
+        rows = db.session.execute(
+            text(f"SELECT rowid FROM {kind}_fts WHERE {kind}_fts MATCH :match "
+                 f"ORDER BY bm25({kind}_fts, {weights}) LIMIT :limit OFFSET :offset"),
+            {'match': match, 'limit': limit, 'offset': offset})
+        return [row[0] for row in rows]
+
+class MemorySearchIndex:
+    # Índice invertido en proceso con ranking BM25; se usa cuando la base de datos no es SQLite
+    name = 'memory'
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rebuild_lock = threading.Lock()
+        self.built = False
+        self.built_at = 0.0
+        self.postings = {kind: {} for kind in SEARCH_FIELDS}  # término -> {id: frecuencia ponderada}
+        self.lengths = {kind: {} for kind in SEARCH_FIELDS}  # id -> longitud ponderada del documento
+        self.documents = {kind: {} for kind in SEARCH_FIELDS}  # id -> términos indexados
+        self.sorted_terms = {kind: None for kind in SEARCH_FIELDS}  # para expandir prefijos con bisect
+
+    def install(self):
+        return True
+
+    def _weighted_terms(self, kind, obj):
+        frequencies = {}
+        for field, weight in SEARCH_FIELDS[kind][1]:
+            for term in tokenize_search_text(getattr(obj, field)):
+                frequencies[term] = frequencies.get(term, 0) + weight
+        return frequencies
+
+    def _remove(self, kind, doc_id):
+        for term in self.documents[kind].pop(doc_id, {}):
+            docs = self.postings[kind].get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[kind][term]
+                    self.sorted_terms[kind] = None
+        self.lengths[kind].pop(doc_id, None)
+
+    def _add(self, kind, doc_id, frequencies):
+        self.documents[kind][doc_id] = frequencies
+        self.lengths[kind][doc_id] = sum(frequencies.values())
+        for term, frequency in frequencies.items():
+            if term not in self.postings[kind]:
+                self.sorted_terms[kind] = None
+            self.postings[kind].setdefault(term, {})[doc_id] = frequency
+
+    def index(self, kind, obj):
+        frequencies = self._weighted_terms(kind, obj)
+        with self.lock:
+            self._remove(kind, obj.id)
+            self._add(kind, obj.id, frequencies)
+
+    def remove(self, kind, doc_id):
+        with self.lock:
+            self._remove(kind, doc_id)
+
+    def rebuild(self):
+        started = time.monotonic()
+        fresh = MemorySearchIndex()
+        for kind, (model, fields) in SEARCH_FIELDS.items():
+            last_id = 0
+            while True:
+                rows = db.session.query(model.id, *[getattr(model, field) for field, _ in fields]) \
+                    .filter(model.id > last_id).order_by(model.id).limit(1000).all()
+                if not rows:
+                    break
+                for row in rows:
+                    fresh._add(kind, row.id, fresh._weighted_terms(kind, row))
+                last_id = rows[-1].id
+        with self.lock:
+            self.postings, self.lengths, self.documents = fresh.postings, fresh.lengths, fresh.documents
+            self.sorted_terms = {kind: None for kind in SEARCH_FIELDS}
+            self.built, self.built_at = True, started
+
+    def _expand(self, kind, prefix):
+        terms = self.sorted_terms[kind]
+        if terms is None:
+            terms = self.sorted_terms[kind] = sorted(self.postings[kind])
+        start = bisect.bisect_left(terms, prefix)
+        expanded = []
+        for term in terms[start:]:
+            if not term.startswith(prefix):
+                break
+            expanded.append(term)
+        return expanded
+
+    def refresh(self):
+        # Cada proceso tiene su índice y solo ve sus propias escrituras: pasado SEARCH_INDEX_TTL lo reconstruye una
+        # petición mientras las demás siguen con el anterior (la primera construcción sí se espera)
+        if self.built and time.monotonic() - self.built_at < app.config['SEARCH_INDEX_TTL']:
+            return
+        if self.rebuild_lock.acquire(blocking=not self.built):
+            try:
+                if not self.built or time.monotonic() - self.built_at >= app.config['SEARCH_INDEX_TTL']:
+                    self.rebuild()
+            finally:
+                self.rebuild_lock.release()
+
+    def search(self, kind, query, limit, offset=0):
+        self.refresh()
+        terms = tokenize_search_text(query)
+        if not terms:
+            return []
+        with self.lock:
+            total_docs = len(self.lengths[kind]) or 1
+            average_length = sum(self.lengths[kind].values()) / total_docs or 1
+            scores = None
+            for prefix in terms:
+                term_scores = {}
+                for term in self._expand(kind, prefix):
+                    docs = self.postings[kind][term]
+                    idf = math.log(1 + (total_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                    for doc_id, frequency in docs.items():
+                        norm = self.k1 * (1 - self.b + self.b * self.lengths[kind][doc_id] / average_length)
+                        term_scores[doc_id] = term_scores.get(doc_id, 0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+                # Todos los términos deben aparecer (igual que FTS5)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {doc_id: score + term_scores[doc_id] for doc_id, score in scores.items() if doc_id in term_scores}
+                if not scores:
+                    return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [doc_id for doc_id, _ in ranked[offset:offset + limit]]
+
+search_index = None
+
+def get_search_index():
+    global search_index
+    if search_index is None:
+        backend = os.environ.get('SEARCH_BACKEND')
+        if backend is None:
+            # Las tablas FTS5 las crea "init-db"; si no existen (SQLite sin FTS5) se usa el índice en memoria
+            backend = 'fts5' if db.engine.dialect.name == 'sqlite' and inspect(db.engine).has_table('video_fts') else 'memory'
+        search_index = FTS5SearchIndex() if backend == 'fts5' else MemorySearchIndex()
+    return search_index
+
+def init_search_index():
+    global search_index
+    if os.environ.get('SEARCH_BACKEND') is None and db.engine.dialect.name == 'sqlite':
+        search_index = FTS5SearchIndex()  # Intentar crear las tablas FTS5 aunque todavía no existan
+    index = get_search_index()
+    try:
+        needs_rebuild = index.install()
+    except OperationalError:
+        # SQLite compilado sin FTS5: usar el índice en memoria
+        app.logger.warning('FTS5 no disponible, se usa el índice de búsqueda en memoria.')
+        index = search_index = MemorySearchIndex()
+        needs_rebuild = False
+    if needs_rebuild and index.name == 'fts5':
+        index.rebuild()
+
+def search_objects(kind, query, cursor=None, limit=None):
+    # Resultados ordenados por relevancia; el cursor guarda el desplazamiento en el ranking
+    limit = limit or page_limit()
+    values = decode_cursor(cursor)
+    try:
+        offset = max(0, int(values[0])) if values else 0
+    except (TypeError, ValueError, IndexError):
+        offset = 0
+    ids = get_search_index().search(kind, query, limit + 1, offset)
+    next_cursor = encode_cursor(offset + limit) if len(ids) > limit else None
+    ids = ids[:limit]
+    model = SEARCH_FIELDS[kind][0]
+    objects = {obj.id: obj for obj in model.query.filter(model.id.in_(ids))} if ids else {}
+    # Los ids obsoletos del índice en memoria simplemente se descartan
+    return [objects[doc_id] for doc_id in ids if doc_id in objects], next_cursor
+
+@event.listens_for(Video, 'after_insert')
+@event.listens_for(Video, 'after_update')
+def index_video(mapper, connection, target):
+    if isinstance(search_index, MemorySearchIndex) and search_index.built:
+        search_index.index('video', target)
+
+@event.listens_for(Channel, 'after_insert')
+@event.listens_for(Channel, 'after_update')
+def index_channel(mapper, connection, target):
+    if isinstance(search_index, MemorySearchIndex) and search_index.built:
+        search_index.index('channel', target)
+
+@event.listens_for(Video, 'after_delete')
+def unindex_video(mapper, connection, target):
+    if isinstance(search_index, MemorySearchIndex):
+        search_index.remove('video', target.id)
+
+@event.listens_for(Channel, 'after_delete')
+def unindex_channel(mapper, connection, target):
+    if isinstance(search_index, MemorySearchIndex):
+        search_index.remove('channel', target.id)
+
+# Servicio de archivos multimedia: rangos de bytes, ETags fuertes y sendfile/mmap
+MediaInfo = namedtuple('MediaInfo', ['path', 'size', 'mtime', 'etag', 'mimetype'])
+media_info_cache = OrderedDict()  # ruta -> (expira, MediaInfo); LRU acotado
+media_info_lock = threading.Lock()
+MEDIA_CHUNK_SIZE = 256 * 1024
+MEDIA_MAX_RANGES = 16  # Más rangos que esto se responde con el archivo completo
+
+def get_media_info(path):
+    # Metadatos del archivo cacheados unos segundos para no hacer stat en cada petición
+    now = time.monotonic()
+    with media_info_lock:
+        cached = media_info_cache.get(path)
+        if cached and cached[0] > now:
+            media_info_cache.move_to_end(path)
+            return cached[1]
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    info = MediaInfo(path, st.st_size, int(st.st_mtime), f'{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}',
+                     mimetypes.guess_type(path)[0] or 'application/octet-stream')
+    with media_info_lock:
+        media_info_cache[path] = (now + app.config['MEDIA_STAT_TTL'], info)
+        media_info_cache.move_to_end(path)
+        while len(media_info_cache) > app.config['MEDIA_STAT_CACHE_SIZE']:
+            media_info_cache.popitem(last=False)
+    return info
+
+def media_path(directory, filename):
+    # Ruta absoluta dentro de directory o None si filename intenta salir de él
+    return safe_join(os.path.abspath(directory), filename)
+
+def invalidate_media_info(path):
+    with media_info_lock:
+        media_info_cache.pop(path, None)
+
+def media_ranges(info):
+    # Rangos satisfacibles como (inicio, fin) exclusivos; None = sin rango válido, [] = insatisfacible
+    byte_range = request.range
+    if byte_range is None or byte_range.units != 'bytes' or len(byte_range.ranges) > MEDIA_MAX_RANGES:
+        return None
+    if request.if_range.etag or request.if_range.date:
+        # If-Range: solo se respetan los rangos si el archivo no cambió
+        if request.if_range.etag != info.etag and request.if_range.date != datetime.fromtimestamp(info.mtime, timezone.utc):
+            return None
+    ranges = []
+    for start, stop in byte_range.ranges:
+        if start < 0:
+            start, stop = max(info.size + start, 0), info.size
+        stop = info.size if stop is None else min(stop, info.size)
+        if start < stop:
+            ranges.append((start, stop))
+    return ranges
+
+def sendfile_body(info, start, stop):
+    # El servidor (gunicorn) envía el archivo con sendfile sin copiarlo a Python; gunicorn
+    # limita el envío al Content-Length, así que también sirve para un rango parcial
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    partial = start > 0 or stop < info.size
+    if file_wrapper is None or (partial and not request.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn')):
+        return None
+    f = open(info.path, 'rb')
+    f.seek(start)
+    return file_wrapper(f, MEDIA_CHUNK_SIZE)
+
+def mmap_body(info, parts):
+    # parts: lista de (prefijo, inicio, fin, sufijo); lee el archivo mapeado en memoria por trozos
+    with open(info.path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if info.size else None
+        try:
+            for prefix, start, stop, suffix in parts:
+                if prefix:
+                    yield prefix
+                for offset in range(start, stop, MEDIA_CHUNK_SIZE):
+                    yield mapped[offset:min(offset + MEDIA_CHUNK_SIZE, stop)]
+                if suffix:
+                    yield suffix
+        finally:
+            if mapped is not None:
+                mapped.close()
+
+def serve_media(directory, filename, max_age=None, immutable=False):
+    path = media_path(directory, filename)
+    info = get_media_info(path) if path else None
+    if info is None:
+        abort(404)
+    cache_control = f"public, max-age={app.config['MEDIA_MAX_AGE'] if max_age is None else max_age}"
+    if immutable:
+        cache_control += ', immutable'
+    headers = {
+        'ETag': f'"{info.etag}"',
+        'Last-Modified': http_date(info.mtime),
+        'Cache-Control': cache_control,
+        'Accept-Ranges': 'bytes'
+    }
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(info.etag)
+    else:
+        not_modified = bool(request.if_modified_since) and request.if_modified_since.timestamp() >= info.mtime
+    if not_modified:
+        return Response(status=304, headers=headers)
+    ranges = media_ranges(info)
+    if ranges == []:
+        headers['Content-Range'] = f'bytes */{info.size}'
+        return Response(status=416, headers=headers)
+    if not ranges or (len(ranges) == 1 and ranges[0] == (0, info.size)):
+        status, start, stop = 200, 0, info.size
+    elif len(ranges) == 1:
+        status, (start, stop) = 206, ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{info.size}'
+    else:
+        # Varios rangos: multipart/byteranges
+        boundary = secrets.token_hex(16)
+        parts = []
+        length = 0
+        for start, stop in ranges:
+            prefix = (f'\r\n--{boundary}\r\nContent-Type: {info.mimetype}\r\n'
+                      f'Content-Range: bytes {start}-{stop - 1}/{info.size}\r\n\r\n').encode()
+            parts.append((prefix, start, stop, b''))
+            length += len(prefix) + stop - start
+        closing = f'\r\n--{boundary}--\r\n'.encode()
+        parts[-1] = parts[-1][:3] + (closing,)
+        length += len(closing)
+        headers['Content-Length'] = str(length)
+        return Response(mmap_body(info, parts), status=206, headers=headers,
+                        mimetype=f'multipart/byteranges; boundary={boundary}', direct_passthrough=True)
+    headers['Content-Length'] = str(stop - start)
+    body = sendfile_body(info, start, stop) or mmap_body(info, [(b'', start, stop, b'')])
+    return Response(body, status=status, headers=headers, mimetype=info.mimetype, direct_passthrough=True)
+
+# Almacenamiento por contenido: la clave es el SHA-256 repartido en subdirectorios (ab/cd/<hash>.ext), los
+# archivos idénticos se guardan una sola vez y Blob.refcount cuenta cuántas filas los usan
+BLOB_KEY_RE = re.compile(r'[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]+)?')
+
+def blob_key(digest, filename):
+    return f'{digest[:2]}/{digest[2:4]}/{digest}{os.path.splitext(filename)[1].lower()}'
+
+def is_blob_key(name):
+    return bool(name and BLOB_KEY_RE.fullmatch(name))
+
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+class LocalStorage:
+    # Backend en disco; otro backend (almacén de objetos) solo necesita los mismos métodos
+    name = 'local'
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return media_path(self.root, key)
+
+    def temp_path(self):
+        # Temporales en el mismo sistema de archivos para que put() sea un rename
+        directory = os.path.join(self.root, '.tmp')
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, secrets.token_hex(16))
+
+    def exists(self, key):
+        path = self.path(key)
+        return bool(path) and os.path.isfile(path)
+
+    def modified(self, key):
+        try:
+            return datetime.utcfromtimestamp(os.path.getmtime(self.path(key)))
+        except (OSError, TypeError):
+            return None
+
+    def put(self, src_path, key):
+        # Siempre os.replace a su clave, aunque ya exista (mismo contenido): si el GC apartó el archivo justo antes,
+        # la copia nueva queda en su sitio igualmente. Devuelve True si la clave no existía
+        path = self.path(key)
+        existed = os.path.exists(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(src_path, path)
+        os.utime(path)  # El GC no borra un archivo que se acaba de volver a subir
+        return not existed
+
+    def delete(self, key, in_use=None):
+        # Aparta el archivo con un rename y vuelve a preguntar in_use(key, modificado) antes de borrarlo; si volvió
+        # a usarse se restaura. Devuelve True si lo borró
+        path = self.path(key)
+        if not path:
+            return False
+        aside = self.temp_path()
+        try:
+            os.rename(path, aside)
+        except FileNotFoundError:
+            return False
+        if in_use is not None and in_use(key, datetime.utcfromtimestamp(os.path.getmtime(aside))):
+            if os.path.exists(path):
+                os.remove(aside)  # Un put() ya dejó la misma copia
+            else:
+                os.replace(aside, path)
+            return False
+        os.remove(aside)
+        invalidate_media_info(path)
+        return True
+
+    def keys(self):
+        for directory, subdirectories, files in os.walk(self.root):
+            subdirectories[:] = [name for name in subdirectories if not name.startswith('.')]
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, '/')
+                if is_blob_key(key):
+                    yield key
+
+    def url(self, key):
+        return url_for('media_file', key=key)
+
+    def serve(self, key):
+        return serve_media(self.root, key, max_age=app.config['BLOB_MAX_AGE'], immutable=True)
+
+STORAGE_BACKENDS = {'local': LocalStorage}
+storage = None
+
+def get_storage():
+    global storage
+    if storage is None:
+        root = app.config['MEDIA_STORAGE_ROOT'] or os.path.join(app.config['UPLOAD_FOLDER'], 'blobs')
+        storage = STORAGE_BACKENDS[app.config['MEDIA_STORAGE']](root)
+    return storage
+
+def store_file(src_path, filename, digest=None):
+    # Guarda un archivo temporal por su contenido; devuelve (clave, tamaño). La referencia la registra attach_blob
+    digest = digest or file_sha256(src_path)
+    key = blob_key(digest, filename)
+    size = os.path.getsize(src_path)
+    get_storage().put(src_path, key)
+    return key, size
+
+def store_upload(file):
+    # Copia el archivo recibido a un temporal calculando el hash mientras se escribe
+    tmp_path = get_storage().temp_path()
+    hasher = hashlib.sha256()
+    with open(tmp_path, 'wb') as f:
+        for block in iter(lambda: file.stream.read(1024 * 1024), b''):
+            f.write(block)
+            hasher.update(block)
+    return store_file(tmp_path, secure_filename(file.filename), hasher.hexdigest())
+
+def attach_blob(key, size=None):
+    # +1 referencia en la transacción de la fila que lo usa; la primera crea la fila Blob
+    if Blob.query.filter_by(key=key).update({Blob.refcount: Blob.refcount + 1}, synchronize_session=False):
+        return
+    if not insert_ignore(Blob, key=key, size=size, refcount=1):
+        Blob.query.filter_by(key=key).update({Blob.refcount: Blob.refcount + 1}, synchronize_session=False)
+
+def blob_in_use(cutoff):
+    # Segunda comprobación de storage.delete(): archivo subido de nuevo o con fila Blob. Conexión propia para no
+    # leer la instantánea de la transacción en curso
+    def in_use(key, modified):
+        if modified >= cutoff:
+            return True
+        with db.engine.connect() as conn:
+            return conn.execute(db.select(Blob.id).where(Blob.key == key)).first() is not None
+    return in_use
+
+def release_blobs(column, condition):
+    # Sentencia que descuenta las referencias de las filas (condition) que dejan de usar el archivo de column
+    removed = db.select(db.func.count()).select_from(column.table).where(column == Blob.key, condition).scalar_subquery()
+    return db.update(Blob).where(Blob.key.in_(db.select(column).where(condition))) \
+        .values(refcount=Blob.refcount - removed, released_at=datetime.utcnow())
+
+def media_file_path(name):
+    # Ruta local de una clave de contenido o de un nombre antiguo en UPLOAD_FOLDER
+    if is_blob_key(name):
+        return get_storage().path(name)
+    return media_path(app.config['UPLOAD_FOLDER'], name)
+
+@app.template_global()
+def media_url(name):
+    # Las claves de contenido se sirven con caché inmutable; los nombres antiguos siguen en /uploads
+    if is_blob_key(name):
+        return get_storage().url(name)
+    return url_for('uploaded_file', filename=name)
+
+def blob_references():
+    return (Video.__table__.c.filename, User.__table__.c.profile_pic)
+
+def recount_blobs(conn, batch_size=1000):
+    # Recalcula refcount desde las filas y crea las filas Blob que falten; devuelve cuántos blobs corrigió
+    counts = {}
+    for column in blob_references():
+        for name, count in conn.execute(db.select(column, db.func.count()).group_by(column)):
+            if is_blob_key(name):
+                counts[name] = counts.get(name, 0) + count
+    blob = Blob.__table__
+    now = datetime.utcnow()
+    update = blob.update().where(blob.c.id == db.bindparam('row_id')).values(
+        refcount=db.bindparam('new_refcount'), released_at=db.bindparam('new_released_at'))
+    fixed = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(db.select(blob.c.id, blob.c.key, blob.c.refcount)
+                            .where(blob.c.id > last_id).order_by(blob.c.id).limit(batch_size)).all()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            count = counts.pop(row.key, 0)
+            if count != row.refcount:
+                updates.append({'row_id': row.id, 'new_refcount': count, 'new_released_at': now})
+        if updates:
+            conn.execute(update, updates)
+            fixed += len(updates)
+        last_id = rows[-1].id
+    missing = [{'key': key, 'size': os.path.getsize(get_storage().path(key)), 'refcount': count, 'created_at': now}
+               for key, count in counts.items() if get_storage().exists(key)]
+    if missing:
+        conn.execute(blob.insert(), missing)
+    return fixed + len(missing)
+
+def collect_blobs(grace=None, batch_size=500):
+    # Borra los archivos que llevan más de grace segundos sin referencias; devuelve (archivos, bytes) liberados
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config['BLOB_GC_GRACE'] if grace is None else grace)
+    freed = reclaimed = 0
+    candidates = db.session.query(Blob.id, Blob.key, Blob.size) \
+        .filter(Blob.refcount <= 0, Blob.released_at < cutoff).order_by(Blob.id).limit(batch_size).all()
+    for blob_id, key, size in candidates:
+        # DELETE condicional: si alguien volvió a usarlo entre la consulta y aquí, se conserva
+        deleted = Blob.query.filter(Blob.id == blob_id, Blob.refcount <= 0).delete(synchronize_session=False)
+        db.session.commit()
+        if deleted and get_storage().delete(key, blob_in_use(cutoff)):
+            freed += 1
+            reclaimed += size or 0
+    return freed, reclaimed
+
+# Subidas por partes: init -> PUT de trozos -> finalize, escribiendo directo a disco y reanudables
+UPLOAD_KINDS = {'video': ['mp4', 'mp3'], 'profile_pic': ['jpg', 'png']}
+upload_hashers = {}  # upload_id -> (offset, sha256 parcial) de este proceso
+upload_hashers_lock = threading.Lock()
+last_upload_cleanup = 0.0
+
+def partial_upload_dir():
+    return os.path.join(app.config['UPLOAD_FOLDER'], '.partial')
+
+def upload_session_paths(upload_id):
+    # upload_id es hexadecimal; cualquier otra cosa se rechaza para no salir del directorio
+    if not re.fullmatch(r'[0-9a-f]{32}', upload_id or ''):
+        return None, None
+    base = os.path.join(partial_upload_dir(), upload_id)
+    return base + '.json', base + '.part'
+
+def load_upload_session(upload_id):
+    meta_path, data_path = upload_session_paths(upload_id)
+    if meta_path is None:
+        return None
+    try:
+        with open(meta_path) as f:
+            upload_session = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if 'result' in upload_session:
+        upload_session['offset'] = upload_session['size']  # Ya finalizada: el archivo parcial pasó al almacén
+    else:
+        upload_session['offset'] = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+    return upload_session
+
+def save_upload_session(upload_session):
+    meta_path, _ = upload_session_paths(upload_session['id'])
+    upload_session['updated_at'] = time.time()
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({key: value for key, value in upload_session.items() if key != 'offset'}, f)
+    os.replace(tmp_path, meta_path)
+
+def discard_upload_session(upload_id):
+    with upload_hashers_lock:
+        upload_hashers.pop(upload_id, None)
+    meta_path, data_path = upload_session_paths(upload_id)
+    for path in (meta_path, data_path, meta_path and upload_lock_path(meta_path)):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+def upload_lock_path(meta_path):
+    return meta_path[:-len('.json')] + '.lock'
+
+@contextlib.contextmanager
+def upload_session_lock(upload_id):
+    # Serializa trozos y finalize de una misma sesión entre hilos y procesos; quien entra debe releer la sesión
+    meta_path, _ = upload_session_paths(upload_id)
+    with open(upload_lock_path(meta_path), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def upload_request_data():
+    # Cuerpo JSON o formulario; None si el JSON no es un objeto o sus campos de texto no son cadenas
+    data = request.get_json(silent=True)
+    if data is None:
+        return request.form
+    if not isinstance(data, dict) or not all(isinstance(data.get(field, ''), str) for field in ('filename', 'title', 'description', 'sha256')):
+        return None
+    return data
+
+def upload_hasher(upload_id, data_path, offset):
+    # Recupera el hash parcial; si otro proceso recibió trozos (o hubo reinicio) se recalcula desde disco
+    with upload_hashers_lock:
+        cached = upload_hashers.get(upload_id)
+    if cached and cached[0] == offset:
+        return cached[1]
+    hasher = hashlib.sha256()
+    if offset:
+        with open(data_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(block)
+    return hasher
+
+def append_upload_chunk(upload_session, offset, stream):
+    # Escribe el cuerpo de la petición en el archivo parcial mientras llega y actualiza el hash
+    _, data_path = upload_session_paths(upload_session['id'])
+    with open(data_path, 'ab') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            current = f.seek(0, os.SEEK_END)
+            if current != offset:
+                return current, False
+            hasher = upload_hasher(upload_session['id'], data_path, current)
+            remaining = upload_session['size'] - current
+            try:
+                while remaining > 0:
+                    block = stream.read(min(64 * 1024, remaining))
+                    if not block:
+                        break
+                    f.write(block)
+                    hasher.update(block)
+                    current += len(block)
+                    remaining -= len(block)
+            finally:
+                # Aunque la conexión se corte, lo recibido queda en disco y el cliente reanuda desde aquí
+                f.flush()
+                with upload_hashers_lock:
+                    upload_hashers[upload_session['id']] = (current, hasher)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return current, True
+
+def cleanup_upload_sessions(max_age=None):
+    # Borra sesiones sin actividad reciente; devuelve cuántas se eliminaron
+    global last_upload_cleanup
+    last_upload_cleanup = time.time()
+    max_age = app.config['UPLOAD_SESSION_TTL'] if max_age is None else max_age
+    removed = 0
+    directory = partial_upload_dir()
+    if not os.path.isdir(directory):
+        return removed
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        upload_id = name[:-len('.json')]
+        meta_path, data_path = upload_session_paths(upload_id)
+        if meta_path is None:
+            continue
+        last_activity = max((os.path.getmtime(path) for path in (meta_path, data_path) if os.path.exists(path)), default=0)
+        if time.time() - last_activity > max_age:
+            discard_upload_session(upload_id)
+            removed += 1
+    return removed
+
+# Cola de trabajos en segundo plano: tabla Job + pool de hilos que nunca bloquea la petición
+job_handlers = {}
+job_pool = {'pid': None, 'threads': [], 'wakeup': threading.Event(), 'stop': threading.Event(), 'next_schedule': 0}
+job_pool_lock = threading.Lock()
+
+def job_handler(kind):
+    def register(func):
+        job_handlers[kind] = func
+        return func
+    return register
+
+def enqueue_job(kind, payload=None, max_attempts=None, delay=0):
+    # Se agrega a la sesión actual: el trabajo se confirma en el mismo commit que los datos que lo originan
+    job = Job(kind=kind, payload=json.dumps(payload or {}),
+              max_attempts=max_attempts or app.config['JOB_MAX_ATTEMPTS'],
+              run_after=datetime.utcnow() + timedelta(seconds=delay))
+    db.session.add(job)
+    start_job_workers()
+    job_pool['wakeup'].set()
+    return job
+
+def claim_job():
+    # Toma un trabajo pendiente (o uno colgado por un worker caído) con un UPDATE condicional
+    now = datetime.utcnow()
+    claimable = ((Job.status == 'pending') & (Job.run_after <= now)) | \
+                ((Job.status == 'running') & (Job.started_at < now - timedelta(seconds=app.config['JOB_TIMEOUT'])))
+    for job_id, in db.session.query(Job.id).filter(claimable).order_by(Job.id).limit(5):
+        claimed = Job.query.filter(Job.id == job_id, claimable).update(
+            {Job.status: 'running', Job.attempts: Job.attempts + 1, Job.started_at: now}, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+    return None
+
+def run_job(job):
+    handler = job_handlers.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f'Tipo de trabajo desconocido: {job.kind}')
+        handler(json.loads(job.payload or '{}'))
+        job.status = 'done'
+        job.last_error = None
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job.id)
+        job.last_error = f'{type(e).__name__}: {e}'
+        if job.attempts < job.max_attempts:
+            # Reintento con espera exponencial
+            job.status = 'pending'
+            job.run_after = datetime.utcnow() + timedelta(seconds=app.config['JOB_RETRY_DELAY'] * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+        app.logger.exception('Falló el trabajo %s (%s)', job.id, job.kind)
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+def run_pending_jobs(limit=None):
+    # Ejecuta trabajos hasta vaciar la cola (o hasta limit); devuelve cuántos se ejecutaron
+    executed = 0
+    while limit is None or executed < limit:
+        job = claim_job()
+        if job is None:
+            break
+        run_job(job)
+        executed += 1
+    return executed
+
+# Trabajos periódicos: tipo -> clave de configuración con el intervalo en segundos
+PERIODIC_JOBS = {'recompute_trending': 'TRENDING_REFRESH_INTERVAL', 'trim_timelines': 'FEED_TRIM_INTERVAL',
+                 'collect_garbage': 'GC_INTERVAL'}
+
+def schedule_periodic_jobs():
+    # Encola cada trabajo periódico que no esté pendiente y cuya última ejecución sea más vieja que su intervalo;
+    # si dos procesos coinciden se ejecuta dos veces, lo que es inofensivo
+    now = datetime.utcnow()
+    kinds = list(PERIODIC_JOBS)
+    active = {kind for kind, in db.session.query(Job.kind).filter(Job.kind.in_(kinds), Job.status.in_(('pending', 'running'))).distinct()}
+    last_done = dict(db.session.query(Job.kind, db.func.max(Job.finished_at))
+                     .filter(Job.kind.in_(kinds), Job.status == 'done').group_by(Job.kind).all())
+    for kind, interval in PERIODIC_JOBS.items():
+        last = last_done.get(kind)
+        if kind not in active and (last is None or last <= now - timedelta(seconds=app.config[interval])):
+            enqueue_job(kind)
+    db.session.commit()
+
+def job_worker_loop():
+    while not job_pool['stop'].is_set():
+        try:
+            with app.app_context():
+                if time.monotonic() >= job_pool['next_schedule']:
+                    job_pool['next_schedule'] = time.monotonic() + app.config['JOB_SCHEDULE_INTERVAL']
+                    schedule_periodic_jobs()
+                executed = run_pending_jobs(limit=10)
+        except Exception:
+            app.logger.exception('Error en el worker de trabajos')
+            executed = 0
+        if not executed:
+            job_pool['wakeup'].wait(app.config['JOB_POLL_INTERVAL'])
+            job_pool['wakeup'].clear()
+
+def start_job_workers():
+    # Arranque perezoso y seguro tras fork: cada proceso tiene su propio pool
+    if job_pool['pid'] == os.getpid() or app.config['JOB_WORKERS'] <= 0:
+        return
+    with job_pool_lock:
+        if job_pool['pid'] == os.getpid():
+            return
+        job_pool.update(pid=os.getpid(), wakeup=threading.Event(), stop=threading.Event(), next_schedule=0)
+        job_pool['threads'] = [threading.Thread(target=job_worker_loop, name=f'job-worker-{i}', daemon=True)
+                               for i in range(app.config['JOB_WORKERS'])]
+        for thread in job_pool['threads']:
+            thread.start()
+
+def stop_job_workers(timeout=None):
+    job_pool['stop'].set()
+    job_pool['wakeup'].set()
+    for thread in job_pool['threads']:
+        thread.join(timeout)
+    job_pool.update(pid=None, threads=[])
+
+def job_metrics():
+    # Resumen para el panel de administración
+    since = datetime.utcnow() - timedelta(hours=1)
+    by_status = dict(db.session.query(Job.status, db.func.count(Job.id)).group_by(Job.status).all())
+    retried = db.session.query(db.func.count(Job.id)).filter(Job.attempts > 1).scalar()
+    finished = db.session.query(Job.started_at, Job.finished_at) \
+        .filter(Job.status == 'done', Job.finished_at >= since).order_by(Job.finished_at.desc()).limit(1000).all()
+    durations = [(finished_at - started_at).total_seconds() for started_at, finished_at in finished if started_at]
+    return {
+        'pending': by_status.get('pending', 0),
+        'running': by_status.get('running', 0),
+        'done': by_status.get('done', 0),
+        'failed': by_status.get('failed', 0),
+        'retried': retried,
+        'done_last_hour': len(finished),
+        'per_minute': round(len(finished) / 60, 2),
+        'avg_seconds': round(sum(durations) / len(durations), 3) if durations else 0,
+        'recent_failures': Job.query.filter(Job.last_error.isnot(None)).order_by(Job.id.desc()).limit(10).all()
+    }
+
+# Procesamiento de MP4: "faststart" (moov al inicio) y metadatos de duración y resolución
+MP4_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+def iter_mp4_boxes(data, start=0, end=None):
+    # Recorre cajas sobre bytes en memoria: (tipo, inicio, tamaño_cabecera, tamaño)
+    end = len(data) if end is None else end
+    position = start
+    while position + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, position)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, position + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header:
+            raise ValueError('Caja MP4 inválida')
+        yield box_type, position, header, size
+        position += size
+
+def read_top_level_boxes(f):
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    boxes = []
+    position = 0
+    while position + 8 <= file_size:
+        f.seek(position)
+        header_bytes = f.read(16)
+        size, box_type = struct.unpack_from('>I4s', header_bytes)
+        if size == 1:
+            size = struct.unpack_from('>Q', header_bytes, 8)[0]
+        elif size == 0:
+            size = file_size - position
+        if size < 8:
+            raise ValueError('Caja MP4 inválida')
+        boxes.append((box_type, position, size))
+        position += size
+    return boxes, file_size
+
+def shift_chunk_offsets(moov, shift, low, high):
+    # Suma shift a los offsets de stco/co64 que apuntan a [low, high)
+    moov = bytearray(moov)
+
+    def walk(start, end):
+        for box_type, position, header, size in iter_mp4_boxes(moov, start, end):
+            if box_type in MP4_CONTAINERS:
+                walk(position + header, position + size)
+            elif box_type in (b'stco', b'co64'):
+                count = struct.unpack_from('>I', moov, position + header + 4)[0]
+                fmt, width = ('>I', 4) if box_type == b'stco' else ('>Q', 8)
+                for i in range(count):
+                    entry = position + header + 8 + i * width
+                    offset = struct.unpack_from(fmt, moov, entry)[0]
+                    if low <= offset < high:
+                        offset += shift
+                        if box_type == b'stco' and offset > 0xFFFFFFFF:
+                            raise ValueError('stco desbordado; se necesitaría co64')
+                        struct.pack_into(fmt, moov, entry, offset)
+
+    box_type, position, header, size = next(iter_mp4_boxes(moov))
+    walk(header, size)
+    return bytes(moov)
+
+def copy_file_range(src, dst, start, length):
+    src.seek(start)
+    while length > 0:
+        block = src.read(min(1024 * 1024, length))
+        if not block:
+            break
+        dst.write(block)
+        length -= len(block)
+
+def mp4_faststart(path, output=None):
+    # Mueve moov delante del primer mdat (en el mismo archivo o en output); devuelve True si se reescribió
+    with open(path, 'rb') as src:
+        boxes, file_size = read_top_level_boxes(src)
+        moov = next((box for box in boxes if box[0] == b'moov'), None)
+        mdat = next((box for box in boxes if box[0] == b'mdat'), None)
+        if moov is None or mdat is None or moov[1] < mdat[1]:
+            return False
+        _, moov_start, moov_size = moov
+        insert_at = mdat[1]
+        # Todo lo que hay entre el punto de inserción y moov se desplaza moov_size bytes
+        src.seek(moov_start)
+        patched = shift_chunk_offsets(src.read(moov_size), moov_size, insert_at, moov_start)
+        tmp_path = output or path + '.faststart'
+        with open(tmp_path, 'wb') as dst:
+            copy_file_range(src, dst, 0, insert_at)
+            dst.write(patched)
+            copy_file_range(src, dst, insert_at, moov_start - insert_at)
+            copy_file_range(src, dst, moov_start + moov_size, file_size - moov_start - moov_size)
+    if output is None:
+        os.replace(tmp_path, path)
+    return True
+
+def read_mp4_metadata(path):
+    # Duración en segundos y resolución de la primera pista de video (mvhd y tkhd)
+    with open(path, 'rb') as f:
+        boxes, _ = read_top_level_boxes(f)
+        moov = next((box for box in boxes if box[0] == b'moov'), None)
+        if moov is None:
+            return {}
+        f.seek(moov[1])
+        data = f.read(moov[2])
+    metadata = {}
+
+    def walk(start, end):
+        for box_type, position, header, size in iter_mp4_boxes(data, start, end):
+            body = position + header
+            if box_type in MP4_CONTAINERS:
+                walk(body, position + size)
+            elif box_type == b'mvhd':
+                if data[body] == 1:
+                    timescale, duration = struct.unpack_from('>IQ', data, body + 20)
+                else:
+                    timescale, duration = struct.unpack_from('>II', data, body + 12)
+                if timescale:
+                    metadata['duration'] = duration / timescale
+            elif box_type == b'tkhd' and 'width' not in metadata:
+                dimensions = body + (88 if data[body] == 1 else 76)
+                width, height = struct.unpack_from('>II', data, dimensions)
+                if width and height:
+                    metadata['width'], metadata['height'] = width >> 16, height >> 16
+
+    _, _, header, size = next(iter_mp4_boxes(data))
+    walk(header, size)
+    return metadata
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+@job_handler('process_video')
+def process_video_job(payload):
+    video = db.session.get(Video, payload['video_id'])
+    if video is None:
+        return  # El video se borró antes de procesarse
+    path = media_file_path(video.filename)
+    if not path or not os.path.exists(path):
+        raise FileNotFoundError(video.filename)
+    if video.filename.lower().endswith('.mp4'):
+        if is_blob_key(video.filename):
+            # El archivo puede estar compartido: la versión optimizada es otro blob y el video pasa a usarlo
+            tmp_path = get_storage().temp_path()
+            if mp4_faststart(path, tmp_path):
+                key, size = store_file(tmp_path, video.filename)
+                attach_blob(key, size)
+                db.session.execute(release_blobs(Video.filename, Video.id == video.id))
+                video.filename = key
+                path = get_storage().path(key)
+        elif mp4_faststart(path):
+            invalidate_media_info(path)
+        metadata = read_mp4_metadata(path)
+        video.duration = metadata.get('duration')
+        video.width = metadata.get('width')
+        video.height = metadata.get('height')
+    video.checksum = video.filename.rsplit('/', 1)[1][:64] if is_blob_key(video.filename) else file_sha256(path)
+    db.session.commit()
+
+# Caché de fragmentos renderizados: LRU acotado en entradas y bytes, con invalidación por etiquetas
+class FragmentCache:
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # clave -> (expira, valor, etiquetas, tamaño)
+        self.tags = {}  # etiqueta -> claves
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def _drop(self, key):
+        _, _, tags, size = self.entries.pop(key)
+        self.size -= size
+        for tag in tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, tags, size):
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (time.monotonic() + self.ttl, value, frozenset(tags), size)
+            self.size += size
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self.lock:
+            for tag in tags:
+                for key in list(self.tags.get(tag, ())):
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.tags.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+fragment_cache = FragmentCache(app.config['PAGE_CACHE_MAX_ENTRIES'], app.config['PAGE_CACHE_MAX_BYTES'], app.config['PAGE_CACHE_TTL'])
+
+def viewer_class():
+    # Lo único del usuario que cambia el contenido compartido: si ve anuncios o no
+    if not g.current_user:
+        return 'anonymous'
+    return 'paid' if has_active_plan(g.current_user) else 'free'
+
+def cached_fragment(key, tags, render):
+    # render() devuelve (html, extra); solo se llama si el fragmento no está en caché
+    if not app.config['PAGE_CACHE_ENABLED']:
+        return render()
+    # Quien acaba de escribir no lee de la caché: lo que renderiza desde el principal reemplaza la entrada
+    value = None if g.get('db_sticky') else fragment_cache.get(key)
+    if value is None:
+        value = render()
+        fragment_cache.set(key, value, tags, len(value[0]))
+    return value
+
+def invalidate_fragments(*tags):
+    fragment_cache.invalidate(*tags)
+
+# Contadores de seguidores: incrementos atómicos en SQL y un búfer opcional de escritura diferida
+class FollowerBuffer:
+    # Acumula deltas por canal y los aplica por lotes; un follow y un unfollow seguidos se anulan sin tocar la base
+    def __init__(self):
+        self.deltas = {}
+        self.lock = threading.Lock()
+        self.pid = None
+        self.stop = threading.Event()
+
+    def add(self, channel_id, delta):
+        self.start()
+        with self.lock:
+            self.deltas[channel_id] = self.deltas.get(channel_id, 0) + delta
+
+    def pending(self, channel_id):
+        with self.lock:
+            return self.deltas.get(channel_id, 0)
+
+    def flush(self):
+        with self.lock:
+            deltas, self.deltas = self.deltas, {}
+        updates = [{'channel_id': channel_id, 'delta': delta} for channel_id, delta in deltas.items() if delta]
+        if not updates:
+            return 0
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text('UPDATE channel SET followers = followers + :delta WHERE id = :channel_id'), updates)
+        except Exception:
+            # Se devuelven los deltas para el próximo intento
+            with self.lock:
+                for update in updates:
+                    self.deltas[update['channel_id']] = self.deltas.get(update['channel_id'], 0) + update['delta']
+            raise
+        return len(updates)
+
+    def run(self):
+        while not self.stop.wait(app.config['FOLLOWER_FLUSH_INTERVAL']):
+            try:
+                with app.app_context():
+                    self.flush()
+            except Exception:
+                app.logger.exception('Error al aplicar los deltas de seguidores')
+
+    def start(self):
+        # Un hilo por proceso (también tras fork)
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.deltas = {}  # Tras un fork los deltas heredados los aplica el proceso padre
+            self.stop = threading.Event()
+            threading.Thread(target=self.run, name='follower-flush', daemon=True).start()
+            atexit.register(self.shutdown)
+
+    def shutdown(self):
+        self.stop.set()
+        try:
+            with app.app_context():
+                self.flush()
+        except Exception:
+            app.logger.exception('No se pudieron aplicar los deltas de seguidores al salir')
+
+follower_buffer = FollowerBuffer()
+
+def adjust_followers(channel_id, delta):
+    if app.config['FOLLOWER_WRITE_BEHIND']:
+        # Se aplica al búfer solo si la transacción se confirma
+        db.session.info.setdefault('follower_deltas', []).append((channel_id, delta))
+    else:
+        Channel.query.filter_by(id=channel_id).update({Channel.followers: Channel.followers + delta}, synchronize_session=False)
+
+@event.listens_for(db.session, 'after_commit')
+def apply_buffered_follower_deltas(session):
+    for channel_id, delta in session.info.pop('follower_deltas', []):
+        follower_buffer.add(channel_id, delta)
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_buffered_follower_deltas(session):
+    session.info.pop('follower_deltas', None)
+
+INSERT_IGNORE = {'sqlite': sqlite_insert, 'postgresql': postgresql_insert}
+
+def insert_ignore(model, **values):
+    # INSERT ... ON CONFLICT DO NOTHING; devuelve True si insertó la fila. No usa savepoint: con pysqlite el
+    # RELEASE de un SAVEPOINT que abre la transacción confirma la fila aunque luego se haga rollback
+    insert = INSERT_IGNORE.get(db.engine.dialect.name)
+    if insert is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(model(**values))
+        except IntegrityError:
+            return False
+        return True
+    return db.session.execute(insert(model).values(**values).on_conflict_do_nothing()).rowcount > 0
+
+def follow_channel(user_id, channel_id):
+    # Devuelve False si ya lo seguía; la restricción única evita duplicados aunque haya carreras
+    if not insert_ignore(Follow, user_id=user_id, channel_id=channel_id):
+        return False
+    adjust_followers(channel_id, 1)
+    backfill_timeline(user_id, channel_id)
+    return True
+
+def unfollow_channel(user_id, channel_id):
+    removed = Follow.query.filter_by(user_id=user_id, channel_id=channel_id).delete(synchronize_session=False)
+    if removed:
+        adjust_followers(channel_id, -removed)
+        TimelineEntry.query.filter_by(user_id=user_id, channel_id=channel_id).delete(synchronize_session=False)
+    return bool(removed)
+
+def channel_followers(channel):
+    # Valor mostrado: lo guardado más lo que aún está en el búfer de este proceso
+    return channel.followers + follower_buffer.pending(channel.id)
+
+def reconcile_follower_counts(batch_size=500):
+    # followers = seguidores reales (Follow) + seguidores otorgados por el admin; devuelve canales corregidos
+    if app.config['FOLLOWER_WRITE_BEHIND']:
+        follower_buffer.flush()
+    fixed = 0
+    last_id = 0
+    while True:
+        batch = db.session.query(Channel.id, Channel.followers, Channel.followers_offset) \
+            .filter(Channel.id > last_id).order_by(Channel.id).limit(batch_size).all()
+        if not batch:
+            break
+        ids = [row.id for row in batch]
+        counts = dict(db.session.query(Follow.channel_id, db.func.count(Follow.id))
+                      .filter(Follow.channel_id.in_(ids)).group_by(Follow.channel_id).all())
+        updates = [{'id': row.id, 'followers': counts.get(row.id, 0) + (row.followers_offset or 0)}
+                   for row in batch if row.followers != counts.get(row.id, 0) + (row.followers_offset or 0)]
+        if updates:
+            db.session.bulk_update_mappings(Channel, updates)
+            db.session.commit()
+            fixed += len(updates)
+        last_id = batch[-1].id
+    return fixed
+
+@job_handler('reconcile_followers')
+def reconcile_followers_job(payload):
+    reconcile_follower_counts()
+
+@job_handler('recompute_trending')
+def recompute_trending_job(payload):
+    with db.engine.begin() as conn:
+        changed = recompute_trending(conn)
+    if changed:
+        invalidate_fragments('videos')
+
+# Feed de suscripciones: fan-out al escribir para canales pequeños (timeline por usuario) y fan-out al leer
+# para los megacanales, donde copiar cada video a millones de timelines costaría más que leerlo al vuelo
+def is_mega_channel(followers):
+    return (followers or 0) >= app.config['FEED_FANOUT_MAX_FOLLOWERS']
+
+def timeline_rows(user_id, query):
+    # Columnas de TimelineEntry a partir de una consulta de videos, sin duplicar lo que ya está en el timeline
+    return db.insert(TimelineEntry).from_select(
+        ['user_id', 'video_id', 'channel_id', 'upload_date'],
+        query.add_columns(Video.id, Video.channel_id, Video.upload_date).where(~db.exists().where(
+            TimelineEntry.user_id == user_id, TimelineEntry.video_id == Video.id)))
+
+def fanout_video(video_id):
+    # Un INSERT ... SELECT copia el video al timeline de todos los seguidores; devuelve cuántas filas escribió
+    video = db.session.get(Video, video_id)
+    if video is None:
+        return 0
+    followers = db.session.query(Channel.followers).filter_by(id=video.channel_id).scalar()
+    if is_mega_channel(followers):
+        return 0
+    query = db.select(Follow.user_id).join(Video, Video.channel_id == Follow.channel_id).where(Video.id == video_id)
+    return db.session.execute(timeline_rows(Follow.user_id, query)).rowcount
+
+def backfill_timeline(user_id, channel_id):
+    # Al seguir un canal pequeño se copian sus últimos videos para que el feed no empiece vacío
+    followers = db.session.query(Channel.followers).filter_by(id=channel_id).scalar()
+    if is_mega_channel(followers):
+        return
+    recent = db.select(Video.id).where(Video.channel_id == channel_id) \
+        .order_by(Video.upload_date.desc(), Video.id.desc()).limit(app.config['FEED_BACKFILL'])
+    query = db.select(db.literal(user_id)).where(Video.id.in_(recent))
+    db.session.execute(timeline_rows(user_id, query))
+
+def trim_timelines(conn, length=None):
+    # Recorta a FEED_TIMELINE_LENGTH solo los timelines que se pasaron; devuelve cuántas filas borró
+    length = length or app.config['FEED_TIMELINE_LENGTH']
+    oversized = db.select(TimelineEntry.user_id).group_by(TimelineEntry.user_id).having(db.func.count(TimelineEntry.id) > length)
+    ranked = db.select(TimelineEntry.id, db.func.row_number().over(
+        partition_by=TimelineEntry.user_id,
+        order_by=(TimelineEntry.upload_date.desc(), TimelineEntry.video_id.desc())).label('position')) \
+        .where(TimelineEntry.user_id.in_(oversized)).subquery()
+    return conn.execute(db.delete(TimelineEntry).where(
+        TimelineEntry.id.in_(db.select(ranked.c.id).where(ranked.c.position > length)))).rowcount
 
-def get_video_dislikes(video_id):
-    return Like.query.filter_by(video_id=video_id, type='dislike').count()
+def backfill_timelines(conn, length=None):
+    # Reconstrucción completa desde los Follow existentes (migración y datos sintéticos)
+    length = length or app.config['FEED_TIMELINE_LENGTH']
+    followed = db.select(Follow.user_id, Video.id.label('video_id'), Video.channel_id, Video.upload_date,
+                         db.func.row_number().over(partition_by=Follow.user_id,
+                                                   order_by=(Video.upload_date.desc(), Video.id.desc())).label('position')) \
+        .join(Video, Video.channel_id == Follow.channel_id).join(Channel, Channel.id == Follow.channel_id) \
+        .where(Channel.followers < app.config['FEED_FANOUT_MAX_FOLLOWERS']).subquery()
+    conn.execute(db.delete(TimelineEntry))
+    return conn.execute(db.insert(TimelineEntry).from_select(
+        ['user_id', 'video_id', 'channel_id', 'upload_date'],
+        db.select(followed.c.user_id, followed.c.video_id, followed.c.channel_id, followed.c.upload_date)
+        .where(followed.c.position <= length))).rowcount
+
+def timeline_query(user_id, key, limit):
+    # Lectura indexada por ix_timeline_user_date; el join trae el video por clave primaria
+    query = Video.query.join(TimelineEntry, TimelineEntry.video_id == Video.id).filter(TimelineEntry.user_id == user_id)
+    if key:
+        query = query.filter((TimelineEntry.upload_date < key[0]) |
+                             ((TimelineEntry.upload_date == key[0]) & (TimelineEntry.video_id < key[1])))
+    return query.order_by(TimelineEntry.upload_date.desc(), TimelineEntry.video_id.desc()).limit(limit + 1)
+
+def mega_channels_followed(user_id):
+    return [channel_id for channel_id, in db.session.query(Follow.channel_id)
+            .join(Channel, Channel.id == Follow.channel_id)
+            .filter(Follow.user_id == user_id, Channel.followers >= app.config['FEED_FANOUT_MAX_FOLLOWERS'])]
+
+def paginate_feed(user_id, cursor=None, limit=None):
+    # Mezcla el timeline con los videos de los megacanales seguidos (una lectura indexada por canal), todo por
+    # (upload_date, id) descendente con el mismo cursor que paginate_videos; devuelve (videos, siguiente_cursor)
+    limit = limit or page_limit()
+    key = None
+    values = decode_cursor(cursor, 2)
+    if values:
+        try:
+            key = (datetime.fromisoformat(values[0]), int(values[1]))
+        except (TypeError, ValueError, IndexError):
+            key = None
+    candidates = {video.id: video for video in timeline_query(user_id, key, limit)}
+    for channel_id in mega_channels_followed(user_id):
+        for video in paginate_videos(Video.query.filter_by(channel_id=channel_id), cursor, limit, query_only=True):
+            candidates[video.id] = video  # Un canal que creció puede estar en ambos lados
+    videos = sorted(candidates.values(), key=lambda video: (video.upload_date, video.id), reverse=True)
+    next_cursor = None
+    if len(videos) > limit:
+        videos = videos[:limit]
+        next_cursor = encode_cursor(videos[-1].upload_date, videos[-1].id)
+    return videos, next_cursor
+
+@job_handler('fanout_video')
+def fanout_video_job(payload):
+    fanout_video(payload['video_id'])
+
+@job_handler('trim_timelines')
+def trim_timelines_job(payload):
+    with db.engine.begin() as conn:
+        trim_timelines(conn)
+
+# Operaciones masivas del admin: una sentencia UPDATE/DELETE por conjunto de ids en lugar de objeto por objeto
+ADMIN_BULK_BATCH = 500  # Ids por sentencia (límite de parámetros de SQLite)
+
+def unindex_rows(kind, model, condition):
+    # Los borrados por conjunto no disparan los eventos del ORM: quitar del índice en memoria a mano
+    if isinstance(search_index, MemorySearchIndex):
+        for (doc_id,) in db.session.query(model.id).filter(condition):
+            search_index.remove(kind, doc_id)
+
+def id_chunks(ids):
+    ids = sorted(ids)
+    return [ids[start:start + ADMIN_BULK_BATCH] for start in range(0, len(ids), ADMIN_BULK_BATCH)]
+
+def refresh_trending_scores(video_ids):
+    # Reescribe trending_score de los videos cuyos contadores se acaban de ajustar en bloque (misma transacción)
+    video = Video.__table__
+    rows = db.session.execute(db.select(video.c.id, video.c.likes, video.c.dislikes, video.c.comments_count, video.c.upload_date)
+                              .where(video.c.id.in_(video_ids))).all()
+    if rows:
+        db.session.execute(video.update().where(video.c.id == db.bindparam('row_id')).values(trending_score=db.bindparam('new_score')),
+                           [{'row_id': row.id, 'new_score': trending_score(row.likes, row.dislikes, row.comments_count, row.upload_date)}
+                            for row in rows])
+
+def discount_comments(condition):
+    # Descontar de comments_count los comentarios que se van a borrar
+    touched = [video_id for video_id, in db.session.query(Comment.video_id).filter(condition).distinct()]
+    removed = db.select(db.func.count(Comment.id)).where(Comment.video_id == Video.id, condition).scalar_subquery()
+    Video.query.filter(Video.id.in_(touched)) \
+        .update({Video.comments_count: Video.comments_count - removed}, synchronize_session=False)
+    refresh_trending_scores(touched)
+
+def discount_reactions(condition):
+    touched = [video_id for video_id, in db.session.query(Like.video_id).filter(condition).distinct()]
+    for reaction, column in (('like', Video.likes), ('dislike', Video.dislikes)):
+        reactions = (condition, Like.type == reaction)
+        removed = db.select(db.func.count(Like.id)).where(Like.video_id == Video.id, *reactions).scalar_subquery()
+        Video.query.filter(Video.id.in_(db.select(Like.video_id).where(*reactions))) \
+            .update({column: column - removed}, synchronize_session=False)
+    refresh_trending_scores(touched)
+
+def discount_follows(condition):
+    unfollowed = db.select(db.func.count(Follow.id)).where(Follow.channel_id == Channel.id, condition).scalar_subquery()
+    Channel.query.filter(Channel.id.in_(db.select(Follow.channel_id).where(condition))) \
+        .update({Channel.followers: Channel.followers - unfollowed}, synchronize_session=False)
+
+def delete_comments(ids):
+    discount_comments(Comment.id.in_(ids))
+    return Comment.query.filter(Comment.id.in_(ids)).delete(synchronize_session=False)
+
+# Borrados en cascada: la parte síncrona quita de una vez (una sentencia por tabla) los usuarios, canales y videos
+# para que dejen de verse, y el trabajo cascade_delete limpia likes, comentarios, follows y timelines por lotes,
+# cada lote en su propia transacción, ajustando los contadores que dependían de ellos
+def delete_objects(users=(), channels=(), videos=()):
+    # Devuelve {'users': n, 'channels': n, 'videos': n} con las filas borradas
+    users, channels, videos = set(users), set(channels), set(videos)
+    for chunk in id_chunks(users):
+        channels.update(channel_id for channel_id, in db.session.query(Channel.id).filter(Channel.owner_id.in_(chunk)))
+        videos.update(video_id for video_id, in db.session.query(Video.id).filter(Video.uploader_id.in_(chunk)))
+    for chunk in id_chunks(channels):
+        videos.update(video_id for video_id, in db.session.query(Video.id).filter(Video.channel_id.in_(chunk)))
+    deleted = {'users': 0, 'channels': 0, 'videos': 0}
+    for chunk in id_chunks(videos):
+        condition = Video.id.in_(chunk)
+        db.session.execute(release_blobs(Video.filename, condition))
+        unindex_rows('video', Video, condition)
+        deleted['videos'] += Video.query.filter(condition).delete(synchronize_session=False)
+    for chunk in id_chunks(channels):
+        condition = Channel.id.in_(chunk)
+        unindex_rows('channel', Channel, condition)
+        deleted['channels'] += Channel.query.filter(condition).delete(synchronize_session=False)
+    for chunk in id_chunks(users):
+        condition = User.id.in_(chunk)
+        db.session.execute(release_blobs(User.profile_pic, condition))
+        deleted['users'] += User.query.filter(condition).delete(synchronize_session=False)
+    for user_id in users:
+        invalidate_user(user_id)
+    if users or channels or videos:
+        enqueue_job('cascade_delete', {'users': sorted(users), 'channels': sorted(channels), 'videos': sorted(videos)})
+    return deleted
+
+def delete_in_batches(model, condition, before=None):
+    # Borra las filas que cumplen condition en lotes de CASCADE_BATCH_SIZE, confirmando cada uno; before recibe
+    # la condición del lote para ajustar contadores en la misma transacción. Devuelve cuántas filas borró
+    deleted = 0
+    while True:
+        ids = [row_id for row_id, in db.session.query(model.id).filter(condition).limit(app.config['CASCADE_BATCH_SIZE'])]
+        if not ids:
+            return deleted
+        batch = model.id.in_(ids)
+        if before:
+            before(batch)
+        deleted += model.query.filter(batch).delete(synchronize_session=False)
+        db.session.commit()
+
+def cascade_rows(users=(), channels=(), videos=()):
+    # Dependientes de filas ya borradas por delete_objects; idempotente, así que un reintento no descuenta dos veces
+    deleted = {}
+
+    def add(name, count):
+        deleted[name] = deleted.get(name, 0) + count
+
+    for chunk in id_chunks(videos):
+        add('likes', delete_in_batches(Like, Like.video_id.in_(chunk)))
+        add('comments', delete_in_batches(Comment, Comment.video_id.in_(chunk)))
+        add('timeline', delete_in_batches(TimelineEntry, TimelineEntry.video_id.in_(chunk)))
+    for chunk in id_chunks(channels):
+        add('follows', delete_in_batches(Follow, Follow.channel_id.in_(chunk)))
+    for chunk in id_chunks(users):
+        add('likes', delete_in_batches(Like, Like.user_id.in_(chunk), discount_reactions))
+        add('follows', delete_in_batches(Follow, Follow.user_id.in_(chunk), discount_follows))
+        add('comments', delete_in_batches(Comment, Comment.user_id.in_(chunk), discount_comments))
+        add('timeline', delete_in_batches(TimelineEntry, TimelineEntry.user_id.in_(chunk)))
+    return deleted
+
+@job_handler('cascade_delete')
+def cascade_delete_job(payload):
+    users, channels, videos = payload.get('users', []), payload.get('channels', []), payload.get('videos', [])
+    # Páginas de video cuyos contadores o primera página de comentarios dependían de los usuarios borrados
+    touched = set(videos)
+    for chunk in id_chunks(users):
+        for model in (Like, Comment):
+            touched.update(video_id for video_id, in db.session.query(model.video_id).filter(model.user_id.in_(chunk)).distinct())
+    deleted = cascade_rows(users, channels, videos)
+    tags = {f'video:{video_id}' for video_id in touched} | {f'channel:{channel_id}' for channel_id in channels}
+    if deleted.get('likes') or deleted.get('comments'):
+        tags.add('videos')  # Contadores de las tarjetas
+    invalidate_fragments(*tags)
+
+# Recolección de basura periódica: filas cuyo padre ya no existe (borrados viejos o interrumpidos) y archivos
+# que ninguna fila usa; devuelve lo recuperado por tipo
+def orphan_conditions():
+    # (nombre, modelo, condición de huérfano, ajuste de contadores); los discount_* solo tocan padres que siguen existiendo
+    return [
+        ('likes', Like, ~db.exists().where(Video.id == Like.video_id) | ~db.exists().where(User.id == Like.user_id),
+         discount_reactions),
+        ('comments', Comment, ~db.exists().where(Video.id == Comment.video_id) | ~db.exists().where(User.id == Comment.user_id),
+         discount_comments),
+        ('follows', Follow, ~db.exists().where(Channel.id == Follow.channel_id) | ~db.exists().where(User.id == Follow.user_id),
+         discount_follows),
+        ('timeline', TimelineEntry, ~db.exists().where(Video.id == TimelineEntry.video_id) |
+         ~db.exists().where(User.id == TimelineEntry.user_id), None)
+    ]
+
+def collect_orphan_rows():
+    reclaimed = {}
+    # Canales sin dueño y videos sin canal pasan por la cascada normal (blobs, índice de búsqueda)
+    channels = [channel_id for channel_id, in db.session.query(Channel.id).filter(~db.exists().where(User.id == Channel.owner_id))]
+    videos = [video_id for video_id, in db.session.query(Video.id).filter(~db.exists().where(Channel.id == Video.channel_id))]
+    if channels or videos:
+        deleted = delete_objects(channels=channels, videos=videos)
+        db.session.commit()
+        reclaimed.update(channels=deleted['channels'], videos=deleted['videos'])
+    for name, model, orphaned, before in orphan_conditions():
+        reclaimed[name] = reclaimed.get(name, 0) + delete_in_batches(model, orphaned, before)
+    return reclaimed
+
+def collect_unreferenced_files(grace=None):
+    # Archivos del almacén sin fila Blob (subidas interrumpidas), temporales viejos y archivos antiguos de
+    # UPLOAD_FOLDER que ninguna fila nombra; solo los que no se tocaron en grace segundos
+    cutoff = time.time() - (app.config['BLOB_GC_GRACE'] if grace is None else grace)
+    store = get_storage()
+    untracked = set(store.keys())
+    for chunk in id_chunks(untracked):
+        untracked.difference_update(key for key, in db.session.query(Blob.key).filter(Blob.key.in_(chunk)))
+    files = reclaimed = 0
+    in_use = blob_in_use(datetime.utcfromtimestamp(cutoff))
+    for key in untracked:
+        try:
+            st = os.stat(store.path(key))
+        except OSError:
+            continue
+        if st.st_mtime < cutoff and store.delete(key, in_use):
+            files += 1
+            reclaimed += st.st_size
+    paths = []
+    temp_dir = os.path.join(store.root, '.tmp')
+    if os.path.isdir(temp_dir):
+        paths += [os.path.join(temp_dir, name) for name in os.listdir(temp_dir)]
+    folder = app.config['UPLOAD_FOLDER']
+    if os.path.isdir(folder):
+        referenced = set()
+        for column in blob_references():
+            referenced.update(name for name, in db.session.query(column).distinct() if name and not is_blob_key(name))
+        paths += [os.path.join(folder, name) for name in os.listdir(folder)
+                  if not name.startswith('.') and name not in referenced and os.path.isfile(os.path.join(folder, name))]
+    for path in paths:
+        try:
+            st = os.stat(path)
+            if st.st_mtime >= cutoff:
+                continue
+            os.remove(path)
+        except OSError:
+            continue
+        invalidate_media_info(path)
+        files += 1
+        reclaimed += st.st_size
+    return files, reclaimed
+
+def collect_garbage():
+    # Con un borrado en cascada pendiente sus filas ya se van a limpiar: no competir por los mismos contadores
+    pending = db.session.query(Job.id).filter(Job.kind == 'cascade_delete', Job.status.in_(('pending', 'running'))).first()
+    report = {} if pending else collect_orphan_rows()
+    blobs = blob_bytes = 0
+    while True:
+        freed, reclaimed = collect_blobs()
+        if not freed:
+            break
+        blobs += freed
+        blob_bytes += reclaimed
+    files, file_bytes = collect_unreferenced_files()
+    report.update(blobs=blobs, files=files, bytes=blob_bytes + file_bytes)
+    return report
+
+@job_handler('collect_garbage')
+def collect_garbage_job(payload):
+    report = collect_garbage()
+    if report.get('likes') or report.get('comments'):
+        invalidate_fragments('videos')  # Contadores y scores de las tarjetas
+    app.logger.info('Recolección de basura: %s', ', '.join(f'{name}={count}' for name, count in report.items()))
+
+def set_moderators(ids, value):
+    affected = User.query.filter(User.id.in_(ids)).update({User.is_moderator: value}, synchronize_session=False)
+    for user_id in ids:
+        invalidate_user(user_id)
+    return affected
+
+def follower_delta(key, amounts, amount):
+    # Cantidad por fila del CSV (CASE sobre el id) o la misma para todos
+    return db.case(amounts, value=key, else_=amount) if amounts else db.literal(amount)
+
+def add_followers(key, ids, amounts, amount):
+    delta = follower_delta(key, amounts, amount)
+    return Channel.query.filter(key.in_(ids)).update(
+        {Channel.followers: Channel.followers + delta, Channel.followers_offset: Channel.followers_offset + delta},
+        synchronize_session=False)
+
+def remove_followers(key, ids, amounts, amount):
+    # Sin bajar de 0; el offset baja lo mismo que el contador (en SQL la derecha usa los valores previos)
+    delta = follower_delta(key, amounts, amount)
+    remaining = db.case((Channel.followers > delta, Channel.followers - delta), else_=0)
+    return Channel.query.filter(key.in_(ids)).update(
+        {Channel.followers: remaining, Channel.followers_offset: Channel.followers_offset - (Channel.followers - remaining)},
+        synchronize_session=False)
+
+# acción -> (campo con los ids, función(ids, cantidades, cantidad) -> filas afectadas, mensaje)
+ADMIN_BULK_ACTIONS = {
+    'delete_user': ('user_id', lambda ids, amounts, amount: delete_objects(users=ids)['users'], 'Usuarios eliminados'),
+    'assign_moderator': ('user_id', lambda ids, amounts, amount: set_moderators(ids, True), 'Moderadores asignados'),
+    'remove_moderator': ('user_id', lambda ids, amounts, amount: set_moderators(ids, False), 'Moderadores removidos'),
+    'add_followers': ('user_id', lambda *args: add_followers(Channel.owner_id, *args), 'Seguidores agregados a los canales'),
+    'add_followers_user': ('user_id', lambda *args: add_followers(Channel.owner_id, *args), 'Seguidores agregados a los canales'),
+    'remove_followers': ('user_id', lambda *args: remove_followers(Channel.owner_id, *args), 'Seguidores removidos de los canales'),
+    'add_followers_channel': ('channel_id', lambda *args: add_followers(Channel.id, *args), 'Seguidores agregados'),
+    'remove_followers_channel': ('channel_id', lambda *args: remove_followers(Channel.id, *args), 'Seguidores removidos'),
+    'delete_channel': ('channel_id', lambda ids, amounts, amount: delete_objects(channels=ids)['channels'], 'Canales eliminados con sus videos'),
+    'delete_video': ('video_id', lambda ids, amounts, amount: delete_objects(videos=ids)['videos'], 'Videos eliminados'),
+    'delete_comment': ('comment_id', lambda ids, amounts, amount: delete_comments(ids), 'Comentarios eliminados')
+}
+
+BULK_ID_RE = re.compile(r'[0-9]+')  # Solo dígitos ASCII: str.isdigit acepta "²", que int() rechaza
+BULK_AMOUNT_RE = re.compile(r'-?[0-9]+')
+
+def bulk_targets(field):
+    # Ids marcados en la tabla, escritos en "<campo>s" (separados por comas o espacios) o importados de un CSV "id[,cantidad]"
+    ids, amounts = set(), {}
+    for value in request.form.getlist(field) + re.split(r'[\s,;]+', request.form.get(field + 's', '')):
+        if BULK_ID_RE.fullmatch(value.strip()):
+            ids.add(int(value))
+    csv_file = request.files.get('csv_file')
+    if csv_file and csv_file.filename:
+        for row in csv.reader(io.TextIOWrapper(csv_file.stream, encoding='utf-8-sig')):
+            if not row or not BULK_ID_RE.fullmatch(row[0].strip()):
+                continue  # Cabecera o línea vacía
+            target_id = int(row[0])
+            ids.add(target_id)
+            if len(row) > 1 and BULK_AMOUNT_RE.fullmatch(row[1].strip()):
+                amounts[target_id] = int(row[1])
+    return sorted(ids), amounts
+
+def run_bulk_action(action):
+    # Devuelve (mensaje, filas afectadas); todo en una transacción
+    field, handler, message = ADMIN_BULK_ACTIONS[action]
+    ids, amounts = bulk_targets(field)
+    try:
+        amount = int(request.form.get('amount') or 0)
+    except ValueError:
+        amount = 0
+    affected = 0
+    for start in range(0, len(ids), ADMIN_BULK_BATCH):
+        batch = ids[start:start + ADMIN_BULK_BATCH]
+        affected += handler(batch, {target_id: amounts[target_id] for target_id in batch if target_id in amounts}, amount)
+    db.session.commit()
+    fragment_cache.clear()  # Acciones masivas poco frecuentes: invalidar todo
+    return message, affected
+
+def admin_dashboard():
+    # Totales del panel con unas pocas consultas agregadas
+    plans = db.session.query(User.plan, db.func.count(User.id),
+                             db.func.sum(db.case((User.is_moderator, 1), else_=0))).group_by(User.plan).all()
+    channels, followers = db.session.query(db.func.count(Channel.id), db.func.coalesce(db.func.sum(Channel.followers), 0)).one()
+    videos, likes, dislikes = db.session.query(db.func.count(Video.id), db.func.coalesce(db.func.sum(Video.likes), 0),
+                                               db.func.coalesce(db.func.sum(Video.dislikes), 0)).one()
+    return {
+        'users': sum(count for _, count, _ in plans),
+        'moderators': sum(moderators or 0 for _, _, moderators in plans),
+        'plans': {plan or 'sin plan': count for plan, count, _ in plans},
+        'channels': channels,
+        'followers': followers,
+        'videos': videos,
+        'likes': likes,
+        'dislikes': dislikes,
+        'comments': db.session.query(db.func.count(Comment.id)).scalar(),
+        'top_channels': db.session.query(Channel.id, Channel.name, Channel.followers)
+            .order_by(Channel.followers.desc()).limit(5).all()
+    }
+
+# Migraciones versionadas: cada una tiene up/down y queda registrada en schema_migrations
+def column_names(conn, table):
+    return {column['name'] for column in inspect(conn).get_columns(table)}
+
+def add_column(conn, model, name):
+    # Agrega la columna tal como está declarada en el modelo (idempotente para bases ya parcheadas)
+    table = model.__table__
+    if name in column_names(conn, table.name):
+        return False
+    column = table.columns[name]
+    ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column.type.compile(dialect=conn.dialect)}'
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    conn.execute(text(ddl))
+    return True
+
+def drop_column(conn, model, name):
+    if name in column_names(conn, model.__tablename__):
+        conn.execute(text(f'ALTER TABLE "{model.__tablename__}" DROP COLUMN "{name}"'))
+
+def create_indexes(conn, indexes):
+    for index in indexes:
+        index.create(conn, checkfirst=True)
+
+def drop_indexes(conn, indexes):
+    for index in indexes:
+        index.drop(conn, checkfirst=True)
+
+def reaction_counters_up(conn):
+    add_column(conn, Video, 'likes')
+    add_column(conn, Video, 'dislikes')
+    conn.execute(text(
+        'UPDATE video SET '
+        "likes = (SELECT COUNT(*) FROM \"like\" WHERE \"like\".video_id = video.id AND \"like\".type = 'like'), "
+        "dislikes = (SELECT COUNT(*) FROM \"like\" WHERE \"like\".video_id = video.id AND \"like\".type = 'dislike')"))
+
+def reaction_counters_down(conn):
+    drop_column(conn, Video, 'likes')
+    drop_column(conn, Video, 'dislikes')
+
+def job_table_up(conn):
+    Job.__table__.create(conn, checkfirst=True)
+
+def job_table_down(conn):
+    Job.__table__.drop(conn, checkfirst=True)
+
+def video_metadata_up(conn):
+    for name in ('duration', 'width', 'height', 'checksum'):
+        add_column(conn, Video, name)
+
+def video_metadata_down(conn):
+    for name in ('duration', 'width', 'height', 'checksum'):
+        drop_column(conn, Video, name)
+
+def follower_offset_up(conn):
+    if add_column(conn, Channel, 'followers_offset'):
+        # Lo que el contador tiene de más sobre los Follow reales fue otorgado por el admin
+        conn.execute(text('UPDATE channel SET followers_offset = COALESCE(followers, 0) - '
+                          '(SELECT COUNT(*) FROM follow WHERE follow.channel_id = channel.id)'))
+    # Quitar follows duplicados antes del índice único y recalcular sin la inflación
+    conn.execute(text('DELETE FROM follow WHERE id NOT IN (SELECT MIN(id) FROM follow GROUP BY user_id, channel_id)'))
+    create_indexes(conn, [index for index in Follow.__table__.indexes if index.name == 'uq_follow_user_channel'])
+    conn.execute(text('UPDATE channel SET followers = followers_offset + '
+                      '(SELECT COUNT(*) FROM follow WHERE follow.channel_id = channel.id)'))
+
+def follower_offset_down(conn):
+    drop_indexes(conn, [index for index in Follow.__table__.indexes if index.name == 'uq_follow_user_channel'])
+    drop_column(conn, Channel, 'followers_offset')
+
+def hot_path_indexes():
+    # Índices secundarios de las consultas más frecuentes (también declarados en los modelos)
+    names = {'ix_like_video_type', 'ix_like_user_video', 'ix_follow_channel_id', 'ix_comment_video_id',
+             'ix_video_channel_date', 'ix_video_upload_date', 'ix_video_uploader_id', 'ix_channel_owner_id',
+             'ix_job_status_started_at'}
+    return [index for model in (Like, Follow, Comment, Video, Channel, Job)
+            for index in model.__table__.indexes if index.name in names]
+
+def hot_indexes_up(conn):
+    create_indexes(conn, hot_path_indexes())
+
+def hot_indexes_down(conn):
+    drop_indexes(conn, hot_path_indexes())
+
+def trending_indexes():
+    return [index for model in (Video, Job) for index in model.__table__.indexes
+            if index.name in ('ix_video_trending', 'ix_job_kind_status')]
+
+def trending_up(conn):
+    add_column(conn, Video, 'comments_count')
+    add_column(conn, Video, 'trending_score')
+    create_indexes(conn, trending_indexes())
+    recompute_trending(conn)
+
+def trending_down(conn):
+    drop_indexes(conn, trending_indexes())
+    drop_column(conn, Video, 'trending_score')
+    drop_column(conn, Video, 'comments_count')
+
+def timelines_up(conn):
+    TimelineEntry.__table__.create(conn, checkfirst=True)
+    backfill_timelines(conn)
+
+def timelines_down(conn):
+    TimelineEntry.__table__.drop(conn, checkfirst=True)
+
+def blob_storage_up(conn):
+    # Copia cada archivo referenciado de UPLOAD_FOLDER a su clave de contenido. Los originales no se tocan aquí:
+    # si la migración se revierte siguen siendo válidos, y si se confirma quedan sin referencias y los borra el GC
+    Blob.__table__.create(conn, checkfirst=True)
+    moved = {}
+    for column in blob_references():
+        for name, in conn.execute(db.select(column).distinct()):
+            path = media_path(app.config['UPLOAD_FOLDER'], name) if name and not is_blob_key(name) else None
+            if name in moved or not path or not os.path.isfile(path):
+                continue
+            tmp_path = get_storage().temp_path()
+            link_or_copy(path, tmp_path)
+            moved[name], _ = store_file(tmp_path, name)
+    for column in blob_references():
+        if moved:
+            conn.execute(column.table.update().where(column == db.bindparam('old_name')).values({column.name: db.bindparam('new_key')}),
+                         [{'old_name': name, 'new_key': key} for name, key in moved.items()])
+    recount_blobs(conn)
+
+def blob_storage_down(conn):
+    # Vuelve a nombres planos (<hash>.<ext>) en UPLOAD_FOLDER; los blobs quedan en su directorio
+    restored = {}
+    for column in blob_references():
+        for name, in conn.execute(db.select(column).distinct()):
+            if is_blob_key(name) and name not in restored:
+                restored[name] = os.path.basename(name)
+                target = os.path.join(app.config['UPLOAD_FOLDER'], restored[name])
+                if get_storage().exists(name) and not os.path.exists(target):
+                    link_or_copy(get_storage().path(name), target)
+    for column in blob_references():
+        if restored:
+            conn.execute(column.table.update().where(column == db.bindparam('old_key')).values({column.name: db.bindparam('new_name')}),
+                         [{'old_key': key, 'new_name': name} for key, name in restored.items()])
+    Blob.__table__.drop(conn, checkfirst=True)
+
+def cascade_indexes():
+    return [index for index in Comment.__table__.indexes if index.name == 'ix_comment_user_id']
+
+def cascade_indexes_up(conn):
+    create_indexes(conn, cascade_indexes())
+
+def cascade_indexes_down(conn):
+    drop_indexes(conn, cascade_indexes())
+
+MIGRATIONS = [
+    (1, 'contadores de likes/dislikes en video', reaction_counters_up, reaction_counters_down),
+    (2, 'tabla de trabajos en segundo plano', job_table_up, job_table_down),
+    (3, 'metadatos de procesamiento de video', video_metadata_up, video_metadata_down),
+    (4, 'seguidores otorgados y follows únicos', follower_offset_up, follower_offset_down),
+    (5, 'índices de rutas frecuentes', hot_indexes_up, hot_indexes_down),
+    (6, 'contador de comentarios y score de tendencias', trending_up, trending_down),
+    (7, 'timelines del feed de suscripciones', timelines_up, timelines_down),
+    (8, 'almacenamiento de archivos por contenido', blob_storage_up, blob_storage_down),
+    (9, 'índice de comentarios por usuario para los borrados en cascada', cascade_indexes_up, cascade_indexes_down)
+]
+
+def ensure_migrations_table(conn):
+    conn.execute(text('CREATE TABLE IF NOT EXISTS schema_migrations ('
+                      'version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)'))
+
+def applied_migrations():
+    with db.engine.begin() as conn:
+        ensure_migrations_table(conn)
+        return {row[0]: row[1] for row in conn.execute(text('SELECT version, applied_at FROM schema_migrations'))}
+
+def migrate_up(target=None):
+    # Aplica en orden las migraciones pendientes, cada una en su propia transacción
+    applied = applied_migrations()
+    done = []
+    for version, name, up, _ in MIGRATIONS:
+        if version in applied or (target is not None and version > target):
+            continue
+        with db.engine.begin() as conn:
+            up(conn)
+            conn.execute(text('INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)'),
+                         {'version': version, 'name': name, 'applied_at': datetime.utcnow()})
+        done.append((version, name))
+    return done
+
+def migrate_down(target):
+    # Revierte en orden inverso las migraciones aplicadas con versión mayor que target
+    applied = applied_migrations()
+    undone = []
+    for version, name, _, down in reversed(MIGRATIONS):
+        if version not in applied or version <= target:
+            continue
+        with db.engine.begin() as conn:
+            down(conn)
+            conn.execute(text('DELETE FROM schema_migrations WHERE version = :version'), {'version': version})
+        undone.append((version, name))
+    return undone
+
+def stamp_migrations():
+    # Base nueva creada con create_all: ya está en la última versión
+    with db.engine.begin() as conn:
+        ensure_migrations_table(conn)
+        for version, name, _, _ in MIGRATIONS:
+            conn.execute(text('INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)'),
+                         {'version': version, 'name': name, 'applied_at': datetime.utcnow()})
+
+def init_schema():
+    if not inspect(db.engine).has_table('user'):
+        db.create_all()
+        stamp_migrations()
+        return []
+    done = migrate_up()
+    db.create_all()  # Tablas nuevas que no necesitan migración de datos
+    return done
+
+def hot_queries():
+    # Consultas representativas de las rutas calientes para revisar su plan de ejecución
+    cursor = encode_cursor(datetime(2025, 1, 1), 1000)
+    return {
+        'home': paginate_videos(Video.query, cursor, 24, query_only=True),
+        'trending': paginate_videos(Video.query, encode_cursor(1.5, 1000), 24, query_only=True, order='trending'),
+        'channel': paginate_videos(Video.query.filter_by(channel_id=1), cursor, 24, query_only=True),
+        'reaction_counts': db.session.query(Like.video_id, Like.type, db.func.count(Like.id))
+            .filter(Like.video_id.in_([1, 2, 3])).group_by(Like.video_id, Like.type),
+        'existing_like': Like.query.filter_by(user_id=1, video_id=1),
+        'is_following': Follow.query.filter_by(user_id=1, channel_id=1),
+        'follower_counts': db.session.query(Follow.channel_id, db.func.count(Follow.id))
+            .filter(Follow.channel_id.in_([1, 2, 3])).group_by(Follow.channel_id),
+        'video_comments': Comment.query.filter_by(video_id=1),
+        'cascade_user_comments': db.session.query(Comment.id).filter(Comment.user_id.in_([1, 2])).limit(1000),
+        'feed_timeline': timeline_query(1, (datetime(2025, 1, 1), 1000), 24),
+        'feed_mega_channels': db.session.query(Follow.channel_id).join(Channel, Channel.id == Follow.channel_id)
+            .filter(Follow.user_id == 1, Channel.followers >= 10000),
+        'owner_channels': Channel.query.filter_by(owner_id=1),
+        'claim_job': db.session.query(Job.id).filter(
+            ((Job.status == 'pending') & (Job.run_after <= datetime(2025, 1, 1))) |
+            ((Job.status == 'running') & (Job.started_at < datetime(2025, 1, 1)))).order_by(Job.id).limit(5)
+    }
+
+def check_query_plans():
+    # Devuelve {consulta: [detalles que recorren una tabla completa]}; vacío = todo usa índices
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('EXPLAIN QUERY PLAN solo está disponible en SQLite.')
+    problems = {}
+    for name, query in hot_queries().items():
+        sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+        details = [row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+        scans = [detail for detail in details if re.match(r'SCAN \S+$', detail)]
+        if scans:
+            problems[name] = details
+    return problems
+
+# Métricas por petición: consultas SQL, tiempos y tamaño de respuesta por ruta, exportadas en formato de texto en /metrics
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+class Histogram:
+    # Histograma acumulativo por combinación de etiquetas (mismo formato que Prometheus)
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}  # etiquetas -> [conteos por bucket..., suma, total]
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {labels: list(values) for labels, values in self.series.items()}
+
+    def render(self, series):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{format_labels(labels + (("le", str(bound)),))} {cumulative}')
+            lines.append(f'{self.name}_bucket{format_labels(labels + (("le", "+Inf"),))} {values[-1]}')
+            lines.append(f'{self.name}_sum{format_labels(labels)} {round(values[-2], 6)}')
+            lines.append(f'{self.name}_count{format_labels(labels)} {values[-1]}')
+        return lines
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+    def render(self, values):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        lines.extend(f'{self.name}{format_labels(labels)} {value}' for labels, value in sorted(values.items()))
+        return lines
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+request_duration = Histogram('lyviontube_request_duration_seconds', 'Tiempo de la vista hasta la respuesta.', LATENCY_BUCKETS)
+request_queries = Histogram('lyviontube_request_queries', 'Consultas SQL por petición.', QUERY_BUCKETS)
+request_sql_time = Histogram('lyviontube_request_sql_seconds', 'Tiempo total en SQL por petición.', LATENCY_BUCKETS)
+request_render_time = Histogram('lyviontube_request_render_seconds', 'Tiempo renderizando plantillas por petición.', LATENCY_BUCKETS)
+response_size = Histogram('lyviontube_response_bytes', 'Tamaño del cuerpo de la respuesta (si se conoce).', SIZE_BUCKETS)
+requests_total = Counter('lyviontube_requests_total', 'Peticiones atendidas.')
+slow_queries_total = Counter('lyviontube_slow_queries_total', 'Sentencias más lentas que SLOW_QUERY_MS.')
+repeated_queries_total = Counter('lyviontube_repeated_queries_total', 'Formas de consulta repetidas N veces o más dentro de una petición.')
+METRICS = (request_duration, request_queries, request_sql_time, request_render_time, response_size,
+           requests_total, slow_queries_total, repeated_queries_total)
+
+slow_query_logger = app.logger.getChild('slow_sql')
+IN_LIST = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)|\((?:\s*%\(\w+\)s\s*,)+\s*%\(\w+\)s\s*\)')
+
+def query_shape(statement):
+    # Misma forma aunque cambie el largo de una lista IN (...)
+    return IN_LIST.sub('(?)', statement)
+
+def route_label():
+    return request.endpoint or 'unmatched'
+
+def before_sql(conn, cursor, statement, parameters, context, executemany):
+    # En el contexto de la sentencia y no en conn.info: si falla no hay after_sql y no queda nada pendiente
+    context.metrics_started = time.perf_counter()
+
+def after_sql(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.metrics_started
+    in_request = has_request_context()
+    if in_request and 'sql_count' in g:
+        g.sql_count += 1
+        g.sql_time += elapsed
+        shape = query_shape(statement)
+        g.sql_shapes[shape] = g.sql_shapes.get(shape, 0) + 1
+    if elapsed * 1000 >= app.config['SLOW_QUERY_MS']:
+        route = route_label() if in_request else 'background'
+        slow_queries_total.inc((('route', route),))
+        slow_query_logger.warning('SQL lenta (%.1f ms) en %s: %s', elapsed * 1000, route, ' '.join(statement.split()))
+
+def before_render(sender, template, context, **extra):
+    if 'sql_count' in g:
+        g.render_stack.append(time.perf_counter())
+
+def after_render(sender, template, context, **extra):
+    if 'sql_count' in g and g.render_stack:
+        started = g.render_stack.pop()
+        if not g.render_stack:  # Solo el render exterior, para no contar dos veces plantillas anidadas
+            g.render_time += time.perf_counter() - started
+
+if app.config['METRICS_ENABLED']:
+    # Desactivadas no se registra ningún evento: sin costo en cada consulta
+    event.listen(Engine, 'before_cursor_execute', before_sql)
+    event.listen(Engine, 'after_cursor_execute', after_sql)
+    before_render_template.connect(before_render, app)
+    template_rendered.connect(after_render, app)
+
+@app.before_request
+def start_request_metrics():
+    if not app.config['METRICS_ENABLED']:
+        return
+    g.request_started = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+    g.sql_shapes = {}
+    g.render_time = 0.0
+    g.render_stack = []
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_started' not in g:
+        return response
+    route = route_label()
+    labels = (('route', route),)
+    request_duration.observe(labels + (('method', request.method),), time.perf_counter() - g.request_started)
+    request_queries.observe(labels, g.sql_count)
+    request_sql_time.observe(labels, g.sql_time)
+    request_render_time.observe(labels, g.render_time)
+    if response.content_length is not None:
+        response_size.observe(labels, response.content_length)
+    requests_total.inc(labels + (('method', request.method), ('status', str(response.status_code))))
+    # Una misma consulta repetida muchas veces en una petición suele ser un N+1
+    for shape, count in g.sql_shapes.items():
+        if count >= app.config['REPEATED_QUERY_THRESHOLD']:
+            repeated_queries_total.inc(labels)
+            app.logger.warning('%s ejecutó %d veces la misma consulta: %s', route, count, ' '.join(shape.split())[:300])
+    if time.monotonic() - last_metrics_flush >= app.config['METRICS_FLUSH_INTERVAL']:
+        write_metrics_snapshot()
+    return response
+
+# Las series viven en memoria de cada proceso; con varios workers de "serve" un scrape cae en uno solo. Cada
+# proceso vuelca las suyas a METRICS_DIR/<pid>.json (como mucho cada METRICS_FLUSH_INTERVAL segundos, así que
+# un scrape puede ir ese tiempo por detrás) y /metrics suma las de todos los procesos vivos
+PAGE_CACHE_STATS = ('hits', 'misses', 'evictions', 'invalidations', 'bytes')
+last_metrics_flush = 0.0
+
+def metrics_dir():
+    return app.config['METRICS_DIR'] or os.path.join(app.instance_path, 'metrics')
+
+def write_metrics_snapshot():
+    global last_metrics_flush
+    last_metrics_flush = time.monotonic()
+    snapshot = {
+        'metrics': {metric.name: [[labels, values] for labels, values in metric.snapshot().items()] for metric in METRICS},
+        'page_cache': fragment_cache.stats()
+    }
+    directory = metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def read_metrics_snapshots():
+    # Las instantáneas de procesos que ya terminaron se borran: sus contadores se reinician, igual que cuando
+    # gunicorn recicla un worker
+    directory = metrics_dir()
+    snapshots = []
+    for name in sorted(os.listdir(directory)):
+        pid, extension = os.path.splitext(name)
+        if extension != '.json' or not pid.isdigit():
+            continue
+        path = os.path.join(directory, name)
+        if not process_alive(int(pid)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+def merge_series(current, values):
+    # Contadores: suma; histogramas: suma bucket a bucket
+    if current is None:
+        return values
+    if isinstance(values, list):
+        return [a + b for a, b in zip(current, values)]
+    return current + values
+
+def render_metrics():
+    write_metrics_snapshot()
+    snapshots = read_metrics_snapshots()
+    lines = []
+    for metric in METRICS:
+        series = {}
+        for snapshot in snapshots:
+            for labels, values in snapshot['metrics'].get(metric.name, []):
+                labels = tuple(tuple(label) for label in labels)
+                series[labels] = merge_series(series.get(labels), values)
+        lines.extend(metric.render(series))
+    stats = {key: sum(snapshot['page_cache'].get(key, 0) for snapshot in snapshots) for key in PAGE_CACHE_STATS}
+    for key in ('hits', 'misses', 'evictions', 'invalidations'):
+        lines.append(f'# TYPE lyviontube_page_cache_{key}_total counter')
+        lines.append(f'lyviontube_page_cache_{key}_total {stats[key]}')
+    lines.append('# TYPE lyviontube_page_cache_bytes gauge')
+    lines.append(f"lyviontube_page_cache_bytes {stats['bytes']}")
+    return '\n'.join(lines) + '\n'
+
+@app.before_request
+def ensure_background_workers():
+    start_job_workers()
+
+# Rutas GET que pueden leer de la réplica
+READ_ONLY_ENDPOINTS = {'home', 'search', 'channel', 'video', 'api_videos', 'api_search', 'api_channel_videos',
+                       'api_video_comments', 'feed', 'api_feed'}
+
+@app.before_request
+def route_database_reads():
+    # Leer lo propio: durante un rato después de escribir, el usuario sigue leyendo del principal
+    g.db_sticky = time.time() - session.get('db_write_at', 0) < app.config['DB_READ_AFTER_WRITE']
+    g.db_read_only = (request.method in ('GET', 'HEAD') and request.endpoint in READ_ONLY_ENDPOINTS
+                      and not g.db_sticky)
+
+@app.after_request
+def remember_database_write(response):
+    if g.get('db_wrote') and app.config['DATABASE_READ_URL']:
+        session['db_write_at'] = time.time()
+    return response
 
 @app.before_request
 def load_current_user():
-    g.current_user = User.query.get(session.get('user_id')) if session.get('user_id') else None
+    # Los archivos multimedia no necesitan el usuario
+    if request.endpoint in ('uploaded_file', 'media_file', 'static', 'metrics'):
+        g.current_user = None
+        return
+    g.current_user = get_user_snapshot(session['user_id']) if session.get('user_id') else None
 
 # Rutas
 @app.route('/')
 def home():
-    videos = Video.query.all()
-    for video in videos:
-        video.likes = get_video_likes(video.id)
-        video.dislikes = get_video_dislikes(video.id)
-    return render_template('home.html', videos=videos, format_followers=format_followers, current_user=g.current_user)
+    cursor = request.args.get('cursor')
+    limit = page_limit()
+    sort = request.args.get('sort', 'trending')
+    if sort not in VIDEO_ORDERS:
+        sort = 'trending'
+    # Scroll infinito: solo se renderizan las tarjetas nuevas
+    partial = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+    def render_home():
+        videos, next_cursor = paginate_videos(Video.query, cursor, limit, order=sort)
+        template = 'video_cards.html' if partial else 'home.html'
+        return Markup(render_template(template, videos=videos, next_cursor=next_cursor, sort=sort, format_followers=format_followers)), next_cursor
+
+    html, next_cursor = cached_fragment(('home', partial, sort, cursor, limit, viewer_class()), {'videos'}, render_home)
+    if partial:
+        return {'html': html, 'next_cursor': next_cursor}, 200
+    return render_template('page.html', content=html, current_user=g.current_user)
+
+@app.route('/feed')
+def feed():
+    if not g.current_user:
+        return redirect(url_for('login'))
+    videos, next_cursor = paginate_feed(g.current_user.id, request.args.get('cursor'))
+    # Scroll infinito como en la portada; el feed es por usuario, así que no pasa por la caché de fragmentos
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return {'html': render_template('video_cards.html', videos=videos), 'next_cursor': next_cursor}, 200
+    return render_template('feed.html', videos=videos, next_cursor=next_cursor, current_user=g.current_user)
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -158,9 +2840,9 @@ def logout():
 
 @app.route('/profile', methods=['GET', 'POST'])
 def profile():
-    if 'user_id' not in session:
+    if not g.current_user:
         return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = db.session.get(User, g.current_user.id)
     total_followers = sum(channel.followers for channel in user.channels)
     if request.method == 'POST':
         user.nickname = request.form.get('nickname', user.nickname)
@@ -168,45 +2850,56 @@ def profile():
         if 'profile_pic' in request.files:
             file = request.files['profile_pic']
             if file and allowed_file(file.filename, ['jpg', 'png']):
-                filename = secure_filename(file.filename)
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                user.profile_pic = filename
+                key, size = store_upload(file)
+                if key != user.profile_pic:
+                    db.session.execute(release_blobs(User.profile_pic, User.id == user.id))
+                    attach_blob(key, size)
+                    user.profile_pic = key
         db.session.commit()
+        invalidate_user(user.id)
+        fragment_cache.clear()  # El sobrenombre aparece en los comentarios de cualquier video
         flash('Perfil actualizado.', 'success')
     return render_template('profile.html', user=user, format_followers=format_followers, total_followers=total_followers, current_user=g.current_user)
 
 @app.route('/channel/<int:channel_id>', methods=['GET', 'POST'])
 def channel(channel_id):
-    channel = Channel.query.get_or_404(channel_id)
+    channel = db.get_or_404(Channel, channel_id)
     user = g.current_user
     is_following = user and Follow.query.filter_by(user_id=user.id, channel_id=channel_id).first()
     if request.method == 'POST' and user:
         if request.form.get('action') == 'follow' and not is_following:
-            follow = Follow(user_id=user.id, channel_id=channel_id)
-            db.session.add(follow)
-            channel.followers += 1
-            db.session.commit()
+            retry_on_busy(follow_channel)(user.id, channel_id)
+            invalidate_fragments(f'channel:{channel_id}')
             flash('Ahora sigues este canal. Contador actualizado.', 'success')
         elif request.form.get('action') == 'unfollow' and is_following:
-            Follow.query.filter_by(user_id=user.id, channel_id=channel_id).delete()
-            channel.followers -= 1
-            db.session.commit()
+            retry_on_busy(unfollow_channel)(user.id, channel_id)
+            invalidate_fragments(f'channel:{channel_id}')
             flash('Dejaste de seguir este canal. Contador actualizado.', 'success')
         elif request.form.get('action') == 'delete_video':
             video_id = request.form['video_id']
-            video = Video.query.get(video_id)
+            video = db.session.get(Video, video_id)
             if video and video.uploader_id == user.id:
-                db.session.delete(video)
-                db.session.commit()
+                retry_on_busy(delete_objects)(videos=[video.id])
+                invalidate_fragments(f'video:{video_id}', f'channel:{channel_id}', 'videos')
                 flash('Video eliminado.', 'success')
             else:
                 flash('No puedes eliminar este video.', 'error')
         return redirect(url_for('channel', channel_id=channel_id))
-    return render_template('channel.html', channel=channel, format_followers=format_followers, is_following=is_following, user=user, current_user=g.current_user)
+    cursor = request.args.get('cursor')
+    limit = page_limit()
+
+    def render_channel():
+        videos, next_cursor = paginate_videos(Video.query.filter_by(channel_id=channel_id), cursor, limit)
+        return Markup(render_template('channel.html', channel=channel, videos=videos, next_cursor=next_cursor, format_followers=format_followers, is_following=is_following, user=user)), None
+
+    is_owner = bool(user and user.id == channel.owner_id)
+    html, _ = cached_fragment(('channel', channel_id, cursor, limit, viewer_class(), bool(is_following), is_owner),
+                              {f'channel:{channel_id}'}, render_channel)
+    return render_template('page.html', content=html, current_user=g.current_user)
 
 @app.route('/video/<int:video_id>', methods=['GET', 'POST'])
 def video(video_id):
-    video = Video.query.get_or_404(video_id)
+    video = db.get_or_404(Video, video_id)
     channel = video.channel  # Obtener el canal del video
     user = g.current_user
     is_following = user and Follow.query.filter_by(user_id=user.id, channel_id=channel.id).first()
@@ -216,83 +2909,110 @@ def video(video_id):
                 return {'error': 'Debes iniciar sesión.'}, 401
             flash('Debes iniciar sesión.', 'error')
             return redirect(url_for('login'))
-        existing_like = Like.query.filter_by(user_id=user.id, video_id=video_id).first()
-        response_data = {}
-        if request.form.get('action') == 'like':
-            if existing_like and existing_like.type == 'like':
-                db.session.delete(existing_like)
-                response_data['message'] = 'Like quitado.'
-            elif existing_like and existing_like.type == 'dislike':
-                existing_like.type = 'like'
-                response_data['message'] = 'Cambiado a like.'
-            else:
-                new_like = Like(user_id=user.id, video_id=video_id, type='like')
-                db.session.add(new_like)
-                response_data['message'] = 'Like dado.'
-        elif request.form.get('action') == 'dislike':
-            if existing_like and existing_like.type == 'dislike':
-                db.session.delete(existing_like)
-                response_data['message'] = 'Dislike quitado.'
-            elif existing_like and existing_like.type == 'like':
-                existing_like.type = 'dislike'
-                response_data['message'] = 'Cambiado a dislike.'
-            else:
-                new_like = Like(user_id=user.id, video_id=video_id, type='dislike')
-                db.session.add(new_like)
-                response_data['message'] = 'Dislike dado.'
-        elif request.form.get('action') == 'follow_channel':
-            if not is_following:
-                follow = Follow(user_id=user.id, channel_id=channel.id)
-                db.session.add(follow)
-                channel.followers += 1
-                response_data['message'] = 'Ahora sigues este canal.'
-                response_data['is_following'] = True
-            else:
-                response_data['message'] = 'Ya sigues este canal.'
-        elif request.form.get('action') == 'unfollow_channel':
-            if is_following:
-                Follow.query.filter_by(user_id=user.id, channel_id=channel.id).delete()
-                channel.followers -= 1
-                response_data['message'] = 'Dejaste de seguir este canal.'
-                response_data['is_following'] = False
-            else:
-                response_data['message'] = 'No sigues este canal.'
-        elif request.form.get('action') == 'delete_video':
-            if video.uploader_id == user.id:
-                db.session.delete(video)
-                db.session.commit()
-                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                    return {'message': 'Video eliminado.', 'redirect': url_for('home')}, 200
-                flash('Video eliminado.', 'success')
-                return redirect(url_for('home'))
-            else:
-                response_data['error'] = 'No puedes eliminar este video.'
-        elif request.form.get('comment'):
-            new_comment = Comment(content=request.form['comment'], video_id=video_id, user_id=user.id)
-            db.session.add(new_comment)
-            response_data['message'] = 'Comentario agregado.'
-            response_data['comment'] = {
-                'content': request.form['comment'],
-                'user_nickname': user.nickname
-            }
-        db.session.commit()
-        # Actualizar contadores para respuesta
-        response_data['likes'] = get_video_likes(video.id)
-        response_data['dislikes'] = get_video_dislikes(video.id)
-        response_data['followers'] = channel.followers
+        @retry_on_busy
+        def apply_action():
+            # Lectura y escritura en la misma transacción: si SQLite estaba bloqueada se repite completa
+            existing_like = Like.query.filter_by(user_id=user.id, video_id=video_id).first()
+            response_data = {}
+            changed = set()  # Etiquetas de fragmentos afectados por esta escritura
+            new_comment = None
+            if request.form.get('action') == 'like':
+                if existing_like and existing_like.type == 'like':
+                    db.session.delete(existing_like)
+                    apply_reaction_delta(video_id, likes=-1)
+                    response_data['message'] = 'Like quitado.'
+                elif existing_like and existing_like.type == 'dislike':
+                    existing_like.type = 'like'
+                    apply_reaction_delta(video_id, likes=1, dislikes=-1)
+                    response_data['message'] = 'Cambiado a like.'
+                else:
+                    new_like = Like(user_id=user.id, video_id=video_id, type='like')
+                    db.session.add(new_like)
+                    apply_reaction_delta(video_id, likes=1)
+                    response_data['message'] = 'Like dado.'
+                changed.update((f'video:{video_id}', 'videos'))
+            elif request.form.get('action') == 'dislike':
+                if existing_like and existing_like.type == 'dislike':
+                    db.session.delete(existing_like)
+                    apply_reaction_delta(video_id, dislikes=-1)
+                    response_data['message'] = 'Dislike quitado.'
+                elif existing_like and existing_like.type == 'like':
+                    existing_like.type = 'dislike'
+                    apply_reaction_delta(video_id, likes=-1, dislikes=1)
+                    response_data['message'] = 'Cambiado a dislike.'
+                else:
+                    new_like = Like(user_id=user.id, video_id=video_id, type='dislike')
+                    db.session.add(new_like)
+                    apply_reaction_delta(video_id, dislikes=1)
+                    response_data['message'] = 'Dislike dado.'
+                changed.update((f'video:{video_id}', 'videos'))
+            elif request.form.get('action') == 'follow_channel':
+                if follow_channel(user.id, channel.id):
+                    changed.add(f'channel:{channel.id}')
+                    response_data['message'] = 'Ahora sigues este canal.'
+                    response_data['is_following'] = True
+                else:
+                    response_data['message'] = 'Ya sigues este canal.'
+            elif request.form.get('action') == 'unfollow_channel':
+                if unfollow_channel(user.id, channel.id):
+                    changed.add(f'channel:{channel.id}')
+                    response_data['message'] = 'Dejaste de seguir este canal.'
+                    response_data['is_following'] = False
+                else:
+                    response_data['message'] = 'No sigues este canal.'
+            elif request.form.get('action') == 'delete_video':
+                if video.uploader_id == user.id:
+                    delete_objects(videos=[video_id])
+                    response_data['deleted'] = True
+                else:
+                    response_data['error'] = 'No puedes eliminar este video.'
+            elif request.form.get('comment'):
+                # La primera página de comentarios está en el fragmento cacheado del video
+                new_comment = Comment(content=request.form['comment'], video_id=video_id, user_id=user.id)
+                db.session.add(new_comment)
+                apply_comment_delta(video_id, 1)
+                changed.add(f'video:{video_id}')
+                response_data['message'] = 'Comentario agregado.'
+            return response_data, changed, new_comment
+
+        response_data, changed, new_comment = apply_action()
+        if response_data.pop('deleted', False):
+            invalidate_fragments(f'video:{video_id}', f'channel:{channel.id}', 'videos')
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return {'message': 'Video eliminado.', 'redirect': url_for('home')}, 200
+            flash('Video eliminado.', 'success')
+            return redirect(url_for('home'))
+        invalidate_fragments(*changed)
+        if new_comment is not None:
+            # Misma forma que /api/video/<id>/comments para que el cliente lo agregue sin volver a pedir la lista
+            response_data['comment'] = comment_to_dict(new_comment, user)
+        # Actualizar contadores para respuesta (el commit expira el objeto y se recargan las columnas)
+        response_data['likes'] = video.likes
+        response_data['dislikes'] = video.dislikes
+        response_data['followers'] = channel_followers(channel)
+        if request.form.get('action') in ('like', 'dislike') or new_comment is not None:
+            retry_on_busy(refresh_trending_score)(video)  # Con los contadores recién recargados
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return response_data, 200
         return redirect(url_for('video', video_id=video_id))
-    video.likes = get_video_likes(video.id)
-    video.dislikes = get_video_dislikes(video.id)
-    show_ad = g.current_user and not has_active_plan(g.current_user)
-    return render_template('video.html', video=video, channel=channel, is_following=is_following, show_ad=show_ad, format_followers=format_followers, current_user=g.current_user)
+    show_ad = bool(g.current_user and not has_active_plan(g.current_user))
+
+    def render_video():
+        # La primera página de comentarios va en el fragmento (visible sin JS); el resto lo pide la página a la API
+        comments, next_cursor = paginate_comments(video_id)
+        return Markup(render_template('video.html', video=video, channel=channel, is_following=is_following, show_ad=show_ad, user=user,
+                                      comments=comments, next_cursor=next_cursor, format_followers=format_followers)), None
+
+    is_owner = bool(user and user.id == video.uploader_id)
+    html, _ = cached_fragment(('video', video_id, viewer_class(), bool(is_following), is_owner),
+                              {f'video:{video_id}', f'channel:{channel.id}'}, render_video)
+    return render_template('page.html', content=html, current_user=g.current_user)
 
 @app.route('/upload', methods=['GET', 'POST'])
 def upload():
-    if 'user_id' not in session:
+    if not g.current_user:
         return redirect(url_for('login'))
-    user = User.query.get(session['user_id'])
+    user = g.current_user
     channels = Channel.query.filter_by(owner_id=user.id).all()  # Cualquier usuario puede subir a sus canales
     if request.method == 'POST':
         title = request.form['title']
@@ -300,24 +3020,154 @@ def upload():
         channel_id = request.form['channel_id']
         file = request.files['video']
         if file and allowed_file(file.filename, ['mp4', 'mp3']):
-            filename = secure_filename(file.filename)
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-            new_video = Video(title=title, description=description, filename=filename, uploader_id=user.id, channel_id=channel_id)
+            key, size = store_upload(file)
+            new_video = Video(title=title, description=description, filename=key, uploader_id=user.id, channel_id=channel_id)
             db.session.add(new_video)
+            attach_blob(key, size)
+            db.session.flush()
+            enqueue_job('process_video', {'video_id': new_video.id})
+            enqueue_job('fanout_video', {'video_id': new_video.id})
             db.session.commit()
+            invalidate_fragments('videos', f'channel:{new_video.channel_id}')
             flash('Video subido.', 'success')
             return redirect(url_for('home'))
     return render_template('upload.html', channels=channels, current_user=g.current_user)
 
+@app.route('/upload/sessions', methods=['POST'])
+def create_upload_session():
+    if not g.current_user:
+        return {'error': 'Debes iniciar sesión.'}, 401
+    if time.time() - last_upload_cleanup > 600:
+        cleanup_upload_sessions()
+    data = upload_request_data()
+    if data is None:
+        return {'error': 'Datos de la subida no válidos.'}, 400
+    kind = data.get('kind', 'video')
+    filename = secure_filename(data.get('filename', ''))
+    try:
+        size = int(data.get('size', -1))
+    except (TypeError, ValueError):
+        size = -1
+    if kind not in UPLOAD_KINDS or not filename or not allowed_file(filename, UPLOAD_KINDS[kind]):
+        return {'error': 'Tipo de archivo no permitido.'}, 400
+    if size < 0 or size > app.config['MAX_UPLOAD_SIZE']:
+        return {'error': 'Tamaño de archivo no válido.'}, 400
+    upload_session = {
+        'id': secrets.token_hex(16),
+        'user_id': g.current_user.id,
+        'kind': kind,
+        'filename': filename,
+        'size': size,
+        'created_at': time.time()
+    }
+    if kind == 'video':
+        channel = Channel.query.filter_by(id=data.get('channel_id'), owner_id=g.current_user.id).first()
+        if not channel:
+            return {'error': 'Canal no válido.'}, 400
+        upload_session.update(title=data.get('title', ''), description=data.get('description', ''), channel_id=channel.id)
+        if not upload_session['title']:
+            return {'error': 'El título es obligatorio.'}, 400
+    os.makedirs(partial_upload_dir(), exist_ok=True)
+    save_upload_session(upload_session)
+    open(upload_session_paths(upload_session['id'])[1], 'wb').close()
+    return {'upload_id': upload_session['id'], 'offset': 0, 'size': size, 'chunk_size': app.config['UPLOAD_CHUNK_SIZE']}, 201
+
+@app.route('/upload/sessions/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+def upload_session_chunk(upload_id):
+    upload_session = load_upload_session(upload_id)
+    if not upload_session or not g.current_user or upload_session['user_id'] != g.current_user.id:
+        return {'error': 'Sesión de subida no encontrada.'}, 404
+    if request.method == 'GET':
+        return dict(upload_session.get('result', {}), offset=upload_session['offset'], size=upload_session['size'])
+    if request.method == 'DELETE':
+        discard_upload_session(upload_id)
+        return {'message': 'Subida cancelada.'}
+    try:
+        offset = int(request.headers.get('Upload-Offset', request.args.get('offset', -1)))
+    except ValueError:
+        offset = -1
+    if request.content_length is None or request.content_length > app.config['UPLOAD_CHUNK_SIZE']:
+        return {'error': 'Trozo demasiado grande.', 'offset': upload_session['offset']}, 413
+    if offset + request.content_length > upload_session['size']:
+        return {'error': 'El trozo excede el tamaño declarado.', 'offset': upload_session['offset']}, 400
+    with upload_session_lock(upload_id):
+        upload_session = load_upload_session(upload_id)
+        if not upload_session:
+            return {'error': 'Sesión de subida no encontrada.'}, 404
+        if 'result' in upload_session:
+            return {'error': 'La subida ya se completó.', 'offset': upload_session['offset']}, 409
+        current, accepted = append_upload_chunk(upload_session, offset, request.stream)
+        if not accepted:
+            # El cliente debe reanudar desde el desplazamiento real
+            return {'error': 'Desplazamiento incorrecto.', 'offset': current}, 409
+        save_upload_session(upload_session)
+    return {'offset': current, 'size': upload_session['size']}
+
+@app.route('/upload/sessions/<upload_id>/finalize', methods=['POST'])
+def finalize_upload_session(upload_id):
+    upload_session = load_upload_session(upload_id)
+    if not upload_session or not g.current_user or upload_session['user_id'] != g.current_user.id:
+        return {'error': 'Sesión de subida no encontrada.'}, 404
+    with upload_session_lock(upload_id):
+        # Un finalize repetido (doble clic, reintento tras un corte) espera aquí y devuelve el mismo resultado
+        upload_session = load_upload_session(upload_id)
+        if not upload_session:
+            return {'error': 'Sesión de subida no encontrada.'}, 404
+        if 'result' in upload_session:
+            return upload_session['result'], 201
+        if upload_session['offset'] != upload_session['size']:
+            return {'error': 'La subida está incompleta.', 'offset': upload_session['offset']}, 409
+        data = upload_request_data()
+        if data is None:
+            return {'error': 'Datos de la subida no válidos.'}, 400
+        _, data_path = upload_session_paths(upload_id)
+        checksum = upload_hasher(upload_id, data_path, upload_session['offset']).hexdigest()
+        expected = data.get('sha256')
+        if expected and expected.lower() != checksum:
+            discard_upload_session(upload_id)
+            return {'error': 'El archivo llegó dañado, vuelve a subirlo.'}, 422
+        # Se almacena una copia (o enlace): el archivo parcial sigue ahí hasta el commit, así un fallo de la base
+        # deja la sesión completa para reintentar el finalize; el blob sin fila lo recoge la recolección de basura
+        tmp_path = get_storage().temp_path()
+        link_or_copy(data_path, tmp_path)
+        key, size = store_file(tmp_path, upload_session['filename'], checksum)
+        user = g.current_user
+        response_data = {'sha256': checksum}
+        if upload_session['kind'] == 'video':
+            new_video = Video(title=upload_session['title'], description=upload_session['description'], filename=key,
+                              uploader_id=user.id, channel_id=upload_session['channel_id'])
+            db.session.add(new_video)
+            attach_blob(key, size)
+            db.session.flush()
+            enqueue_job('process_video', {'video_id': new_video.id})
+            enqueue_job('fanout_video', {'video_id': new_video.id})
+            db.session.commit()
+            invalidate_fragments('videos', f'channel:{new_video.channel_id}')
+            response_data.update(video_id=new_video.id, redirect=url_for('video', video_id=new_video.id))
+            flash('Video subido.', 'success')
+        else:
+            if key != user.profile_pic:
+                db.session.execute(release_blobs(User.profile_pic, User.id == user.id))
+                attach_blob(key, size)
+                User.query.filter_by(id=user.id).update({User.profile_pic: key}, synchronize_session=False)
+            db.session.commit()
+            invalidate_user(user.id)
+            response_data['redirect'] = url_for('profile')
+            flash('Perfil actualizado.', 'success')
+        # La sesión guarda el resultado hasta que la limpie cleanup_upload_sessions
+        upload_session['result'] = response_data
+        save_upload_session(upload_session)
+        os.remove(data_path)
+    with upload_hashers_lock:
+        upload_hashers.pop(upload_id, None)
+    return response_data, 201
+
 @app.route('/search')
 def search():
     query = request.args.get('q', '').lower()
-    videos = Video.query.filter((Video.title.contains(query)) | (Video.description.contains(query))).all()
-    channels = Channel.query.filter((Channel.name.contains(query)) | (Channel.description.contains(query))).all()
-    for video in videos:
-        video.likes = get_video_likes(video.id)
-        video.dislikes = get_video_dislikes(video.id)
-    return render_template('search.html', videos=videos, channels=channels, query=query, format_followers=format_followers, current_user=g.current_user)
+    videos, next_cursor = search_objects('video', query, request.args.get('cursor'))
+    channels, channels_cursor = search_objects('channel', query, request.args.get('channels_cursor'))
+    return render_template('search.html', videos=videos, channels=channels, query=query, next_cursor=next_cursor, channels_cursor=channels_cursor, format_followers=format_followers, current_user=g.current_user)
 
 @app.route('/plans', methods=['GET', 'POST'])
 def plans():
@@ -360,12 +3210,14 @@ def pay(plan):
                 source=request.form['stripeToken']
             )
             # Si el pago es exitoso, activar el plan
-            g.current_user.plan = plan
+            user = db.session.get(User, g.current_user.id)
+            user.plan = plan
             if plan == 'Básico':
-                g.current_user.plan_expiry = datetime.utcnow() + timedelta(days=30)
+                user.plan_expiry = datetime.utcnow() + timedelta(days=30)
             else:
-                g.current_user.plan_expiry = None
+                user.plan_expiry = None
             db.session.commit()
+            invalidate_user(user.id)
             flash(f'Pago exitoso. Plan {plan} activado.', 'success')
             return redirect(url_for('home'))
         except stripe.error.CardError as e:
@@ -375,115 +3227,58 @@ def pay(plan):
 
 @app.route('/admin', methods=['GET', 'POST'])
 def admin():
-    if 'user_id' not in session or User.query.get(session['user_id']).username != 'LyvionStudio':
+    if not is_admin():
         flash('Acceso denegado.', 'error')
         return redirect(url_for('home'))
-    users = User.query.all()
-    channels = Channel.query.all()
-    videos = Video.query.all()
-    for video in videos:
-        video.likes = get_video_likes(video.id)
-        video.dislikes = get_video_dislikes(video.id)
     if request.method == 'POST':
         action = request.form['action']
-        if action == 'delete_user':
-            user_id = request.form['user_id']
-            user = User.query.get(user_id)
-            db.session.delete(user)
-            db.session.commit()
-            flash('Usuario eliminado.', 'success')
-        elif action == 'assign_moderator':
-            user_id = request.form['user_id']
-            user = User.query.get(user_id)
-            user.is_moderator = True
-            db.session.commit()
-            flash('Moderador asignado.', 'success')
-        elif action == 'delete_comment':
-            comment_id = request.form['comment_id']
-            comment = Comment.query.get(comment_id)
-            db.session.delete(comment)
-            db.session.commit()
-            flash('Comentario eliminado.', 'success')
-        elif action == 'add_followers_user':
-            user_id = request.form['user_id']
-            amount = int(request.form['amount'])
-            user = User.query.get(user_id)
-            # Agregar seguidores a todos los canales del usuario
-            for channel in user.channels:
-                channel.followers += amount
-            db.session.commit()
-            flash(f'Agregados {amount} seguidores a los canales de {user.username}.', 'success')
-        elif action == 'add_followers_channel':
-            channel_id = request.form['channel_id']
-            amount = int(request.form['amount'])
-            channel = Channel.query.get(channel_id)
-            channel.followers += amount
-            db.session.commit()
-            flash(f'Agregados {amount} seguidores al canal {channel.name}.', 'success')
-        elif action == 'delete_channel':
-            channel_id = request.form['channel_id']
-            channel = Channel.query.get(channel_id)
-            # Eliminar videos asociados al canal antes de eliminar el canal
-            Video.query.filter_by(channel_id=channel_id).delete()
-            db.session.delete(channel)
-            db.session.commit()
-            flash(f'Canal {channel.name} y sus videos eliminados.', 'success')
-        elif action == 'delete_video':
-            video_id = request.form['video_id']
-            video = Video.query.get(video_id)
-            db.session.delete(video)
-            db.session.commit()
-            flash('Video eliminado.', 'success')
+        if action not in ADMIN_BULK_ACTIONS:
+            flash('Acción desconocida.', 'error')
+            return redirect(url_for('admin'))
+        message, affected = run_bulk_action(action)
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return {'action': action, 'affected': affected}, 200
+        flash(f'{message}: {affected} filas afectadas.', 'success')
         return redirect(url_for('admin'))
-    return render_template('admin.html', users=users, channels=channels, videos=videos, format_followers=format_followers, current_user=g.current_user)
+    users, users_cursor = paginate_by_id(User.query, User, request.args.get('users_cursor'))
+    channels, channels_cursor = paginate_by_id(Channel.query, Channel, request.args.get('channels_cursor'))
+    videos, videos_cursor = paginate_videos(Video.query.options(joinedload(Video.channel)), request.args.get('videos_cursor'))
+    return render_template('admin.html', dashboard=admin_dashboard(), jobs=job_metrics(), cache_stats=fragment_cache.stats(), users=users, channels=channels, videos=videos, users_cursor=users_cursor, channels_cursor=channels_cursor, videos_cursor=videos_cursor, format_followers=format_followers, current_user=g.current_user)
 
 @app.route('/manage_users', methods=['GET', 'POST'])
 def manage_users():
-    if 'user_id' not in session or User.query.get(session['user_id']).username != 'LyvionStudio':
+    if not is_admin():
         flash('Acceso denegado.', 'error')
         return redirect(url_for('home'))
     query = request.args.get('q', '')
-    users = User.query.filter(User.username.contains(query)).all() if query else User.query.all()
-    # Calcular total_followers para cada usuario
-    for user in users:
-        user.total_followers = sum(channel.followers for channel in user.channels)
-    selected_user = None
     if request.method == 'POST':
-        user_id = request.form['user_id']
-        selected_user = User.query.get(user_id)
         action = request.form['action']
-        if action == 'add_followers':
-            amount = int(request.form['amount'])
-            for channel in selected_user.channels:
-                channel.followers += amount
-            db.session.commit()
-            flash(f'Agregados {amount} seguidores a los canales de {selected_user.username}.', 'success')
-        elif action == 'remove_followers':
-            amount = int(request.form['amount'])
-            for channel in selected_user.channels:
-                channel.followers = max(0, channel.followers - amount)
-            db.session.commit()
-            flash(f'Removidos {amount} seguidores de los canales de {selected_user.username}.', 'success')
-        elif action == 'assign_moderator':
-            selected_user.is_moderator = True
-            db.session.commit()
-            flash(f'{selected_user.username} asignado como moderador.', 'success')
-        elif action == 'remove_moderator':
-            selected_user.is_moderator = False
-            db.session.commit()
-            flash(f'{selected_user.username} removido como moderador.', 'success')
+        if action not in ADMIN_BULK_ACTIONS or ADMIN_BULK_ACTIONS[action][0] != 'user_id':
+            flash('Acción desconocida.', 'error')
+            return redirect(url_for('manage_users', q=query))
+        message, affected = run_bulk_action(action)
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return {'action': action, 'affected': affected}, 200
+        flash(f'{message}: {affected} filas afectadas.', 'success')
         return redirect(url_for('manage_users', q=query))
-    return render_template('manage_users.html', users=users, query=query, selected_user=selected_user, format_followers=format_followers, current_user=g.current_user)
+    users_query = User.query.filter(User.username.contains(query)) if query else User.query
+    users, next_cursor = paginate_by_id(users_query, User, request.args.get('cursor'))
+    # total_followers de toda la página en una consulta agrupada
+    totals = dict(db.session.query(Channel.owner_id, db.func.sum(Channel.followers))
+                  .filter(Channel.owner_id.in_([user.id for user in users])).group_by(Channel.owner_id).all())
+    for user in users:
+        user.total_followers = totals.get(user.id, 0)
+    return render_template('manage_users.html', users=users, query=query, next_cursor=next_cursor, format_followers=format_followers, current_user=g.current_user)
 
 @app.route('/create_channel', methods=['GET', 'POST'])
 def create_channel():
-    if 'user_id' not in session or User.query.get(session['user_id']).username != 'LyvionStudio':
+    if not is_admin():
         flash('Solo LyvionStudio puede crear canales.', 'error')
         return redirect(url_for('home'))
     if request.method == 'POST':
         name = request.form['name']
         description = request.form['description']
-        new_channel = Channel(name=name, description=description, owner_id=session['user_id'])
+        new_channel = Channel(name=name, description=description, owner_id=g.current_user.id)
         db.session.add(new_channel)
         db.session.commit()
         flash('Canal creado.', 'success')
@@ -492,20 +3287,175 @@ def create_channel():
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return serve_media(app.config['UPLOAD_FOLDER'], filename)
+
+@app.route('/media/<path:key>')
+def media_file(key):
+    if not is_blob_key(key):
+        abort(404)
+    return get_storage().serve(key)
+
+@app.route('/metrics')
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if token and not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    if not app.config['METRICS_ENABLED']:
+        abort(404)
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+# API JSON con los mismos cursores que las páginas HTML
+@app.route('/api/videos')
+def api_videos():
+    sort = request.args.get('sort', 'recent')
+    if sort not in VIDEO_ORDERS:
+        return {'error': 'Orden desconocido.'}, 400
+    videos, next_cursor = paginate_videos(Video.query, request.args.get('cursor'), order=sort)
+    return {'videos': [video_to_dict(video) for video in videos], 'next_cursor': next_cursor}
+
+@app.route('/api/feed')
+def api_feed():
+    if not g.current_user:
+        return {'error': 'Debes iniciar sesión.'}, 401
+    videos, next_cursor = paginate_feed(g.current_user.id, request.args.get('cursor'))
+    return {'videos': [video_to_dict(video) for video in videos], 'next_cursor': next_cursor}
+
+@app.route('/api/search')
+def api_search():
+    query = request.args.get('q', '').lower()
+    videos, next_cursor = search_objects('video', query, request.args.get('cursor'))
+    channels, channels_cursor = search_objects('channel', query, request.args.get('channels_cursor'))
+    return {
+        'videos': [video_to_dict(video) for video in videos],
+        'next_cursor': next_cursor,
+        'channels': [channel_to_dict(channel) for channel in channels],
+        'channels_cursor': channels_cursor
+    }
+
+@app.route('/api/video/<int:video_id>/comments')
+def api_video_comments(video_id):
+    db.get_or_404(Video, video_id)
+    comments, next_cursor = paginate_comments(video_id, request.args.get('cursor'))
+    return {'comments': [comment_to_dict(comment) for comment in comments], 'next_cursor': next_cursor}
 
-# Inicializar base de datos y crear cuenta LyvionStudio con muchos seguidores y videos graciosos
-with app.app_context():
-    db.create_all()
+@app.route('/api/channel/<int:channel_id>/videos')
+def api_channel_videos(channel_id):
+    db.get_or_404(Channel, channel_id)
+    videos, next_cursor = paginate_videos(Video.query.filter_by(channel_id=channel_id), request.args.get('cursor'))
+    return {'videos': [video_to_dict(video) for video in videos], 'next_cursor': next_cursor}
+
+@app.route('/api/admin/cache')
+def api_admin_cache():
+    if not is_admin():
+        return {'error': 'Acceso denegado.'}, 403
+    return fragment_cache.stats()
+
+@app.route('/api/admin/<listing>')
+def api_admin_listing(listing):
+    if not is_admin():
+        return {'error': 'Acceso denegado.'}, 403
+    cursor = request.args.get('cursor')
+    if listing == 'users':
+        query = request.args.get('q', '')
+        users_query = User.query.filter(User.username.contains(query)) if query else User.query
+        users, next_cursor = paginate_by_id(users_query, User, cursor)
+        return {'users': [user_to_dict(user) for user in users], 'next_cursor': next_cursor}
+    if listing == 'channels':
+        channels, next_cursor = paginate_by_id(Channel.query, Channel, cursor)
+        return {'channels': [channel_to_dict(channel) for channel in channels], 'next_cursor': next_cursor}
+    if listing == 'videos':
+        videos, next_cursor = paginate_videos(Video.query, cursor)
+        return {'videos': [video_to_dict(video) for video in videos], 'next_cursor': next_cursor}
+    return {'error': 'Listado desconocido.'}, 404
+
+# Comandos de mantenimiento (flask --app LyvionTube <comando>)
+@app.cli.command('reconcile-reactions')
+@click.option('--batch-size', default=500, show_default=True, help='Videos por lote.')
+def reconcile_reactions_command(batch_size):
+    fixed = reconcile_reaction_counters(batch_size)
+    click.echo(f'Contadores de reacciones corregidos en {fixed} videos.')
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    index = get_search_index()
+    index.install()
+    index.rebuild()
+    click.echo(f'Índice de búsqueda ({index.name}) reconstruido.')
+
+@app.cli.command('cleanup-uploads')
+@click.option('--max-age', type=int, default=None, help='Segundos sin actividad (por defecto UPLOAD_SESSION_TTL).')
+def cleanup_uploads_command(max_age):
+    removed = cleanup_upload_sessions(max_age)
+    click.echo(f'Subidas incompletas eliminadas: {removed}.')
+
+@app.cli.command('gc')
+def gc_command():
+    report = collect_garbage()
+    click.echo(', '.join(f'{name}: {count}' for name, count in report.items()))
+
+@app.cli.command('reconcile-followers')
+def reconcile_followers_command():
+    fixed = reconcile_follower_counts()
+    click.echo(f'Contadores de seguidores corregidos en {fixed} canales.')
+
+@app.cli.command('db-upgrade')
+@click.option('--to', 'target', type=int, default=None, help='Versión destino (por defecto la última).')
+def db_upgrade_command(target):
+    done = migrate_up(target)
+    for version, name in done:
+        click.echo(f'Aplicada {version:04d}: {name}')
+    if not done:
+        click.echo('La base de datos ya está al día.')
+
+@app.cli.command('db-downgrade')
+@click.option('--to', 'target', type=int, required=True, help='Versión a la que volver (0 = ninguna).')
+def db_downgrade_command(target):
+    for version, name in migrate_down(target):
+        click.echo(f'Revertida {version:04d}: {name}')
+
+@app.cli.command('db-status')
+def db_status_command():
+    applied = applied_migrations()
+    for version, name, _, _ in MIGRATIONS:
+        click.echo(f"{version:04d} {'aplicada ' + str(applied[version]) if version in applied else 'pendiente'}  {name}")
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    problems = check_query_plans()
+    for name, details in problems.items():
+        click.echo(f'{name}: recorrido completo -> ' + ' | '.join(details), err=True)
+    if problems:
+        raise SystemExit(1)
+    click.echo('Todas las consultas calientes usan índices.')
+
+@app.cli.command('run-jobs')
+@click.option('--once', is_flag=True, help='Vaciar la cola y salir.')
+def run_jobs_command(once):
+    if once:
+        app.config['JOB_WORKERS'] = 0  # Todo en este proceso, sin hilos que compitan por la cola
+        schedule_periodic_jobs()
+        click.echo(f'Trabajos ejecutados: {run_pending_jobs()}.')
+        return
+    app.config['JOB_WORKERS'] = max(app.config['JOB_WORKERS'], 1)
+    start_job_workers()
+    click.echo(f"Procesando trabajos con {app.config['JOB_WORKERS']} hilos (Ctrl+C para salir).")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stop_job_workers(timeout=10)
+
+# Cuenta LyvionStudio de ejemplo con muchos seguidores y videos graciosos
+def seed_demo_data():
     if not User.query.filter_by(username='LyvionStudio').first():
         hashed_password = generate_password_hash('LyvionStudiosJuan', method='pbkdf2:sha256')
         lyvion = User(username='LyvionStudio', nickname='LyvionStudio', password=hashed_password, plan='VIP')
         db.session.add(lyvion)
         db.session.commit()
         # Crear canales de ejemplo con muchos seguidores
-        channel1 = Channel(name='Canal Oficial Lyvion', description='Videos épicos de la comunidad.', owner_id=lyvion.id, followers=1200000)
-        channel2 = Channel(name='Tutoriales Pro', description='Aprende con nosotros.', owner_id=lyvion.id, followers=800000)
-        channel3 = Channel(name='Canal Gracioso', description='Videos graciosos para reírte.', owner_id=lyvion.id, followers=500000)
+        channel1 = Channel(name='Canal Oficial Lyvion', description='Videos épicos de la comunidad.', owner_id=lyvion.id, followers=1200000, followers_offset=1200000)
+        channel2 = Channel(name='Tutoriales Pro', description='Aprende con nosotros.', owner_id=lyvion.id, followers=800000, followers_offset=800000)
+        channel3 = Channel(name='Canal Gracioso', description='Videos graciosos para reírte.', owner_id=lyvion.id, followers=500000, followers_offset=500000)
         db.session.add(channel1)
         db.session.add(channel2)
         db.session.add(channel3)
@@ -520,5 +3470,88 @@ with app.app_context():
         db.session.add(video3)
         db.session.commit()
 
+def init_database(seed_demo=True):
+    # Todo lo que antes ocurría al importar el módulo: esquema, índice de búsqueda, carpetas y datos de ejemplo
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    done = init_schema()
+    init_search_index()
+    if seed_demo:
+        seed_demo_data()
+    return done
+
+@app.cli.command('init-db')
+@click.option('--seed/--no-seed', default=True, help='Crear la cuenta y los videos de ejemplo si no existen.')
+def init_db_command(seed):
+    for version, name in init_database(seed):
+        click.echo(f'Aplicada {version:04d}: {name}')
+    click.echo('Base de datos lista.')
+
+def create_app():
+    # Punto de entrada de los servidores: no toca la base de datos (usar "init-db" antes de arrancar)
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    return app
+
+# Servidor de producción: gunicorn con la app precargada antes del fork y workers con hilos
+def dispose_engines():
+    # Las conexiones heredadas del proceso padre no se comparten entre procesos
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+def shutdown_worker():
+    stop_job_workers(timeout=app.config['SHUTDOWN_TIMEOUT'])
+    if app.config['FOLLOWER_WRITE_BEHIND']:
+        follower_buffer.shutdown()
+
+def gunicorn_options(host, port, workers, threads):
+    return {
+        'bind': f'{host}:{port}',
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'preload_app': True,
+        'timeout': app.config['WORKER_TIMEOUT'],
+        'graceful_timeout': app.config['SHUTDOWN_TIMEOUT'],
+        'keepalive': 5,
+        'accesslog': '-',
+        'post_fork': lambda server, worker: dispose_engines(),
+        'worker_exit': lambda server, worker: shutdown_worker()
+    }
+
+def serve(host, port, workers, threads):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        # Sin gunicorn instalado: un proceso con hilos, sin recarga ni depurador
+        from werkzeug.serving import run_simple
+        app.logger.warning('gunicorn no está instalado: se usa el servidor de Werkzeug con un solo proceso.')
+        atexit.register(shutdown_worker)
+        run_simple(host, port, create_app(), threaded=True)
+        return
+
+    class LyvionServer(BaseApplication):
+        def load_config(self):
+            for key, value in gunicorn_options(host, port, workers, threads).items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return create_app()
+
+    LyvionServer().run()
+
+@app.cli.command('serve', with_appcontext=False)
+@click.option('--host', default=os.environ.get('HOST', '0.0.0.0'), show_default=True)
+@click.option('--port', type=int, default=lambda: int(os.environ.get('PORT', 8080)), show_default='$PORT o 8080')
+@click.option('--workers', type=int, default=lambda: app.config['WEB_WORKERS'], show_default='$WEB_CONCURRENCY')
+@click.option('--threads', type=int, default=lambda: app.config['WEB_THREADS'], show_default='$WEB_THREADS')
+@click.option('--dev', is_flag=True, help='Servidor de desarrollo de Flask con recarga y depurador.')
+def serve_command(host, port, workers, threads, dev):
+    if dev:
+        create_app().run(host=host, port=port, debug=True)
+    else:
+        serve(host, port, workers, threads)
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    if len(sys.argv) == 1:
+        sys.argv.append('serve')  # "python LyvionTube.py" sigue arrancando el servidor
+    FlaskGroup(create_app=create_app).main()
@@ -0,0 +1,10 @@
+# benchmark - Datos sintéticos, carga concurrente sobre la app WSGI y reportes comparables de LyvionTube
+# Uso: python -m benchmark seed --scale small && python -m benchmark run --output results/actual.json
+
+# Tamaños por escala; "full" es el conjunto de referencia para comparar despliegues. Viven aquí y no en seed.py
+# porque la CLI los necesita antes de importar la app, que abre la base de DATABASE_URL
+SCALES = {
+    'tiny': {'users': 1000, 'channels': 100, 'videos': 500, 'likes': 20000, 'follows': 5000, 'comments': 10000},
+    'small': {'users': 10000, 'channels': 1000, 'videos': 5000, 'likes': 300000, 'follows': 60000, 'comments': 120000},
+    'full': {'users': 100000, 'channels': 10000, 'videos': 50000, 'likes': 5000000, 'follows': 1000000, 'comments': 2000000}
+}
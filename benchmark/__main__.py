@@ -0,0 +1,82 @@
+# benchmark/__main__.py - Comandos: seed (datos sintéticos), run (carga + reporte JSON) y compare (contra una base)
+import os
+import sys
+
+import click
+
+from benchmark.report import build_report, compare_reports, format_comparison, format_report, load_report, save_report
+from benchmark import SCALES
+
+# Obligatoria en seed y run: ambos escriben en la base (run da likes, comenta y sigue canales como usuarios reales)
+database_option = click.option('--database-url', envvar='DATABASE_URL', required=True,
+                               help='Base de destino (o DATABASE_URL); sin valor por defecto para no usar la base de desarrollo.')
+
+@click.group()
+def cli():
+    pass
+
+@cli.command()
+@click.option('--scale', type=click.Choice(sorted(SCALES)), default='small', help='Tamaño base del conjunto de datos.')
+@click.option('--users', type=int, default=None)
+@click.option('--channels', type=int, default=None)
+@click.option('--videos', type=int, default=None)
+@click.option('--likes', type=int, default=None)
+@click.option('--follows', type=int, default=None)
+@click.option('--comments', type=int, default=None)
+@click.option('--seed', type=int, default=42, help='Semilla: el mismo valor genera los mismos datos.')
+@click.option('--media-mb', type=int, default=8, help='Tamaño del archivo compartido para las pruebas de rangos.')
+@database_option
+def seed(scale, seed, media_mb, database_url, **sizes):
+    # Se importa aquí: importar la app abre la base de DATABASE_URL
+    os.environ['DATABASE_URL'] = database_url
+    from benchmark.seed import seed_database
+    counts = dict(SCALES[scale])
+    counts.update({name: value for name, value in sizes.items() if value is not None})
+    try:
+        seed_database(seed=seed, media_mb=media_mb, log=click.echo, **counts)
+    except RuntimeError as error:
+        raise click.ClickException(str(error))
+
+@cli.command()
+@click.option('--concurrency', type=int, default=8, help='Usuarios virtuales simultáneos.')
+@click.option('--duration', type=float, default=30, help='Segundos medidos (después del calentamiento).')
+@click.option('--requests', type=int, default=None, help='Número fijo de peticiones en lugar de una duración.')
+@click.option('--warmup', type=float, default=5, help='Segundos de calentamiento que no se miden.')
+@click.option('--mix', default=None, help='Pesos por escenario, p. ej. "home=30,search=10,uploads_range=5".')
+@click.option('--cache/--no-cache', default=True, help='Caché de fragmentos de página activada o no.')
+@click.option('--seed', type=int, default=42)
+@click.option('--output', default='benchmark/results/latest.json', help='Archivo JSON del reporte.')
+@click.option('--baseline', default=None, help='Reporte anterior con el que comparar.')
+@click.option('--tolerance', type=float, default=0.15, help='Empeoramiento relativo permitido frente a la base.')
+@database_option
+def run(concurrency, duration, requests, warmup, mix, cache, seed, output, baseline, tolerance, database_url):
+    os.environ['DATABASE_URL'] = database_url
+    from LyvionTube import app
+    from benchmark.driver import parse_mix, run_load
+    app.config['PAGE_CACHE_ENABLED'] = cache
+    mix = parse_mix(mix)
+    samples, elapsed, dataset = run_load(concurrency, duration, requests, warmup, mix, seed)
+    config = {'concurrency': concurrency, 'duration': duration, 'requests': requests, 'warmup': warmup,
+              'mix': mix, 'page_cache': cache, 'seed': seed, 'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0]}
+    report = build_report(samples, elapsed, config, dataset)
+    save_report(report, output)
+    click.echo(format_report(report))
+    click.echo(f'Reporte guardado en {output}')
+    if baseline:
+        rows = compare_reports(load_report(baseline), report, tolerance)
+        click.echo(format_comparison(rows))
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+@cli.command()
+@click.argument('baseline')
+@click.argument('current')
+@click.option('--tolerance', type=float, default=0.15)
+def compare(baseline, current, tolerance):
+    rows = compare_reports(load_report(baseline), load_report(current), tolerance)
+    click.echo(format_comparison(rows))
+    if any(row[-1] for row in rows):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    cli(prog_name='python -m benchmark')
@@ -0,0 +1,159 @@
+# benchmark/driver.py - Carga concurrente en proceso sobre la app WSGI (cliente de pruebas de Flask, un hilo por usuario virtual)
+import random
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from LyvionTube import app, db, User, Channel, Video, Like, Follow, Comment, Blob, media_url
+from benchmark.seed import WORDS, skewed_index
+
+# Mezcla por defecto (pesos relativos) de lo que hace un usuario típico
+DEFAULT_MIX = {
+    'home': 30,
+    'feed': 10,
+    'search': 15,
+    'video_get': 25,
+    'video_like': 8,
+    'video_comment': 4,
+    'channel_follow': 6,
+    'uploads_range': 12
+}
+RANGE_SIZE = 256 * 1024
+SAMPLE_IDS = 10000  # Ids de cada tabla que se cargan para elegir objetivos
+
+query_counter = threading.local()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    query_counter.count = getattr(query_counter, 'count', 0) + 1
+
+def parse_mix(text):
+    # "home=30,search=10" -> {'home': 30, 'search': 10}
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise ValueError(f'Escenario desconocido: {name.strip()}')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def load_targets():
+    with app.app_context():
+        users = [row[0] for row in db.session.query(User.id).order_by(User.id.desc()).limit(SAMPLE_IDS)]
+        videos = [row[0] for row in db.session.query(Video.id).order_by(Video.id).limit(SAMPLE_IDS)]
+        channels = [row[0] for row in db.session.query(Channel.id).order_by(Channel.id).limit(SAMPLE_IDS)]
+        dataset = {
+            'users': db.session.query(db.func.count(User.id)).scalar(),
+            'channels': db.session.query(db.func.count(Channel.id)).scalar(),
+            'videos': db.session.query(db.func.count(Video.id)).scalar(),
+            'likes': db.session.query(db.func.count(Like.id)).scalar(),
+            'follows': db.session.query(db.func.count(Follow.id)).scalar(),
+            'comments': db.session.query(db.func.count(Comment.id)).scalar()
+        }
+        # El blob más referenciado es el archivo compartido que genera el seeder
+        media = db.session.query(Blob.key, Blob.size).order_by(Blob.refcount.desc()).first()
+        with app.test_request_context():
+            media_url_path = media_url(media.key) if media else None
+    if not users or not videos or not channels:
+        raise RuntimeError('La base de datos está vacía: ejecuta primero "python -m benchmark seed".')
+    targets = {'users': users, 'videos': videos, 'channels': channels,
+               'media_url': media_url_path, 'media_size': media.size if media else 0}
+    return targets, dataset
+
+def request_home(client, targets, rng):
+    return client.get('/')
+
+def request_feed(client, targets, rng):
+    return client.get('/feed')
+
+def request_search(client, targets, rng):
+    return client.get('/search', query_string={'q': ' '.join(rng.sample(WORDS, rng.randint(1, 2)))})
+
+def request_video_get(client, targets, rng):
+    video_id = targets['videos'][skewed_index(rng, len(targets['videos']), 2)]
+    return client.get(f'/video/{video_id}')
+
+def request_video_like(client, targets, rng):
+    video_id = targets['videos'][skewed_index(rng, len(targets['videos']), 2)]
+    return client.post(f'/video/{video_id}', data={'action': rng.choice(('like', 'dislike'))},
+                       headers={'X-Requested-With': 'XMLHttpRequest'})
+
+def request_video_comment(client, targets, rng):
+    video_id = targets['videos'][skewed_index(rng, len(targets['videos']), 2)]
+    return client.post(f'/video/{video_id}', data={'action': 'comment', 'comment': ' '.join(rng.sample(WORDS, 5))},
+                       headers={'X-Requested-With': 'XMLHttpRequest'})
+
+def request_channel_follow(client, targets, rng):
+    channel_id = targets['channels'][skewed_index(rng, len(targets['channels']), 3)]
+    return client.post(f'/channel/{channel_id}', data={'action': rng.choice(('follow', 'unfollow'))})
+
+def request_uploads_range(client, targets, rng):
+    start = rng.randrange(max(1, targets['media_size'] - RANGE_SIZE))
+    return client.get(targets['media_url'], headers={'Range': f'bytes={start}-{start + RANGE_SIZE - 1}'})
+
+SCENARIOS = {
+    'home': request_home,
+    'feed': request_feed,
+    'search': request_search,
+    'video_get': request_video_get,
+    'video_like': request_video_like,
+    'video_comment': request_video_comment,
+    'channel_follow': request_channel_follow,
+    'uploads_range': request_uploads_range
+}
+
+def virtual_user(worker, targets, mix, deadline, measure_from, budget, samples, lock, seed):
+    rng = random.Random(seed + worker)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = rng.choice(targets['users'])
+    local = {name: [] for name in names}
+    while time.perf_counter() < deadline:
+        if budget is not None:
+            with lock:
+                if budget[0] <= 0:
+                    break
+                budget[0] -= 1
+        name = rng.choices(names, weights)[0]
+        query_counter.count = 0
+        started = time.perf_counter()
+        try:
+            response = SCENARIOS[name](client, targets, rng)
+            response.get_data()  # Consumir el cuerpo completo (incluye el streaming de /media)
+            status = response.status_code
+            response.close()
+        except Exception:
+            app.logger.exception('Error en el escenario %s', name)
+            status = 599
+        finished = time.perf_counter()
+        if finished >= measure_from:
+            local[name].append((status, finished - started, query_counter.count))
+    with lock:
+        for name, route_samples in local.items():
+            samples.setdefault(name, []).extend(route_samples)
+
+def run_load(concurrency=8, duration=30, requests=None, warmup=5, mix=None, seed=42):
+    # Devuelve (muestras por ruta, segundos medidos, datos del conjunto); las peticiones del calentamiento no cuentan
+    targets, dataset = load_targets()
+    mix = mix or dict(DEFAULT_MIX)
+    samples = {}
+    lock = threading.Lock()
+    budget = [requests] if requests else None
+    started = time.perf_counter()
+    # Con un número fijo de peticiones se miden todas; por duración, se descarta el calentamiento
+    measure_from = started if requests else started + warmup
+    deadline = float('inf') if requests else measure_from + duration
+    threads = [threading.Thread(target=virtual_user, name=f'bench-{worker}',
+                                args=(worker, targets, mix, deadline, measure_from, budget, samples, lock, seed))
+               for worker in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - measure_from, dataset
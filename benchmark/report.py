@@ -0,0 +1,122 @@
+# benchmark/report.py - Latencias por ruta, rendimiento, consultas SQL y memoria; guardado y comparación en JSON
+import json
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+from datetime import datetime
+
+def percentile(values, fraction):
+    # Interpolación lineal sobre valores ya ordenados
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def peak_rss_mb():
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if platform.system() == 'Darwin' else 1024), 1)
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def summarize_route(samples, elapsed):
+    latencies = sorted(seconds * 1000 for _, seconds, _ in samples)
+    queries = [count for _, _, count in samples]
+    statuses = {}
+    for status, _, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for status, _, _ in samples if status >= 500),
+        'statuses': statuses,
+        'throughput': round(len(samples) / elapsed, 2) if elapsed else 0,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else 0,
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p95': round(percentile(latencies, 0.95), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'max': round(latencies[-1], 3) if latencies else 0
+        },
+        'queries': {
+            'mean': round(sum(queries) / len(queries), 2) if queries else 0,
+            'max': max(queries) if queries else 0
+        }
+    }
+
+def build_report(samples, elapsed, config, dataset):
+    # samples: {ruta: [(estado, segundos, consultas), ...]}
+    routes = {route: summarize_route(route_samples, elapsed) for route, route_samples in sorted(samples.items())}
+    everything = [sample for route_samples in samples.values() for sample in route_samples]
+    return {
+        'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'revision': git_revision(),
+        'environment': {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version, 'platform': platform.platform()},
+        'config': config,
+        'dataset': dataset,
+        'elapsed_seconds': round(elapsed, 3),
+        'peak_rss_mb': peak_rss_mb(),
+        'total': summarize_route(everything, elapsed),
+        'routes': routes
+    }
+
+def save_report(report, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+# Métrica -> (cómo leerla del resumen, True si más alto es peor)
+COMPARED_METRICS = {
+    'p50_ms': (lambda summary: summary['latency_ms']['p50'], True),
+    'p95_ms': (lambda summary: summary['latency_ms']['p95'], True),
+    'p99_ms': (lambda summary: summary['latency_ms']['p99'], True),
+    'throughput': (lambda summary: summary['throughput'], False),
+    'queries': (lambda summary: summary['queries']['mean'], True)
+}
+
+def compare_reports(baseline, current, tolerance):
+    # Filas (ruta, métrica, base, actual, cambio relativo, empeoró); una ruta empeora si pasa la tolerancia
+    rows = []
+    pairs = [('total', baseline['total'], current['total'])]
+    pairs += [(route, baseline['routes'][route], summary) for route, summary in current['routes'].items() if route in baseline['routes']]
+    for route, before, after in pairs:
+        for metric, (read, higher_is_worse) in COMPARED_METRICS.items():
+            old, new = read(before), read(after)
+            change = (new - old) / old if old else 0.0
+            regressed = change > tolerance if higher_is_worse else change < -tolerance
+            if metric == 'queries':
+                regressed = new - old >= 0.5  # Media consulta más por petición ya es una regresión (no depende de la máquina)
+            rows.append((route, metric, old, new, change, regressed))
+    rows.append(('total', 'peak_rss_mb', baseline['peak_rss_mb'], current['peak_rss_mb'],
+                 (current['peak_rss_mb'] - baseline['peak_rss_mb']) / baseline['peak_rss_mb'] if baseline['peak_rss_mb'] else 0.0,
+                 current['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance)))
+    return rows
+
+def format_comparison(rows):
+    lines = [f"{'ruta':<18} {'métrica':<12} {'base':>12} {'actual':>12} {'cambio':>9}"]
+    for route, metric, old, new, change, regressed in rows:
+        lines.append(f"{route:<18} {metric:<12} {old:>12} {new:>12} {change:>+8.1%}{'  <-- regresión' if regressed else ''}")
+    return '\n'.join(lines)
+
+def format_report(report):
+    lines = [f"{'ruta':<18} {'peticiones':>10} {'errores':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'consultas':>9}"]
+    for route, summary in list(report['routes'].items()) + [('total', report['total'])]:
+        latency = summary['latency_ms']
+        lines.append(f"{route:<18} {summary['requests']:>10} {summary['errors']:>8} {summary['throughput']:>9} "
+                     f"{latency['p50']:>9} {latency['p95']:>9} {latency['p99']:>9} {summary['queries']['mean']:>9}")
+    lines.append(f"RSS máximo: {report['peak_rss_mb']} MB · {report['elapsed_seconds']} s")
+    return '\n'.join(lines)
@@ -0,0 +1,189 @@
+# benchmark/seed.py - Generador masivo de datos sintéticos (inserciones por lotes con executemany, sin el ORM)
+import random
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from LyvionTube import (app, db, User, Channel, Video, Like, Follow, Comment, get_search_index, get_storage, init_database,
+                        recompute_trending, backfill_timelines, recount_blobs, store_file)
+
+BATCH_SIZE = 10000
+SAMPLE_MEDIA = 'bench-sample.mp4'
+WORDS = ('gato', 'perro', 'tutorial', 'música', 'gracioso', 'épico', 'receta', 'viaje', 'juego', 'fútbol', 'ciencia',
+         'historia', 'película', 'reseña', 'directo', 'baile', 'coche', 'playa', 'montaña', 'programación', 'arte', 'noticias')
+PLANS = (None, None, None, 'Básico', 'Pro', 'VIP')
+
+def skewed_index(rng, size, skew):
+    # Popularidad tipo Zipf aproximada: unos pocos ids concentran la mayoría de las interacciones
+    return min(size - 1, int(size * rng.random() ** skew))
+
+def distinct_picks(rng, count, size, skew):
+    # Índices distintos para un mismo usuario (no se repite el like ni el follow)
+    count = min(count, size)
+    picks = set()
+    while len(picks) < count:
+        picks.add(skewed_index(rng, size, skew) if len(picks) < count * 0.9 else rng.randrange(size))
+    return picks
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+def spread(total, parts, rng):
+    # Reparte total entre parts con variación (cuántos likes/follows/comentarios da cada usuario)
+    average = total / parts
+    counts = [max(0, int(rng.expovariate(1 / average))) if average else 0 for _ in range(parts)]
+    scale = total / (sum(counts) or 1)
+    return [int(count * scale) for count in counts]
+
+def insert_rows(conn, table, rows):
+    if rows:
+        conn.execute(table.insert(), rows)
+    return []
+
+def update_counters(conn, model, rows):
+    # UPDATE con executemany: una sentencia preparada para todos los contadores
+    if not rows:
+        return
+    columns = [name for name in rows[0] if name != 'row_id']
+    # Los parámetros no pueden llamarse como las columnas que se actualizan
+    statement = model.__table__.update().where(model.__table__.c.id == db.bindparam('row_id')) \
+        .values({name: db.bindparam('new_' + name) for name in columns})
+    rows = [{'row_id': row['row_id'], **{'new_' + name: row[name] for name in columns}} for row in rows]
+    for start in range(0, len(rows), BATCH_SIZE):
+        conn.execute(statement, rows[start:start + BATCH_SIZE])
+
+def write_sample_media(size_mb):
+    # Un solo blob compartido por todos los videos para las pruebas de rangos de /media; el contenido depende
+    # solo del tamaño, así que volver a sembrar reutiliza la misma clave
+    rng = random.Random(size_mb)
+    tmp_path = get_storage().temp_path()
+    with open(tmp_path, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(rng.randbytes(1024 * 1024))
+    key, _ = store_file(tmp_path, SAMPLE_MEDIA)
+    return key
+
+def seed_database(users, channels, videos, likes, follows, comments, seed=42, media_mb=8, log=print):
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    timings = {}
+    with app.app_context():
+        init_database(seed_demo=False)
+        # Solo sobre una base vacía o ya sembrada por el benchmark: nunca mezclar con datos reales
+        others = db.session.query(db.func.count(User.id)).filter(~User.username.startswith('bench')).scalar()
+        if others:
+            raise RuntimeError(f'La base tiene {others} usuarios que no son del benchmark: usa una base aparte.')
+        media_key = write_sample_media(media_mb)
+        with db.engine.begin() as conn:
+            if db.engine.dialect.name == 'sqlite':
+                # Solo durante la carga: sin fsync por lote
+                conn.exec_driver_sql('PRAGMA synchronous=OFF')
+            first_user = (conn.execute(db.select(db.func.max(User.id))).scalar() or 0) + 1
+            first_channel = (conn.execute(db.select(db.func.max(Channel.id))).scalar() or 0) + 1
+            first_video = (conn.execute(db.select(db.func.max(Video.id))).scalar() or 0) + 1
+            password = generate_password_hash('benchmark', method='pbkdf2:sha256')  # Un hash para todos: el hash es lo lento
+
+            step = time.perf_counter()
+            plan_expiry = datetime.utcnow() + timedelta(days=30)  # Básico solo cuenta como plan activo con vencimiento
+            rows = []
+            for offset in range(users):
+                user_id = first_user + offset
+                plan = rng.choice(PLANS)
+                rows.append({'id': user_id, 'username': f'bench{user_id}', 'nickname': f'Bench {user_id}', 'password': password,
+                             'plan': plan, 'plan_expiry': plan_expiry if plan == 'Básico' else None, 'is_moderator': False})
+                if len(rows) >= BATCH_SIZE:
+                    rows = insert_rows(conn, User.__table__, rows)
+            insert_rows(conn, User.__table__, rows)
+            timings['users'] = time.perf_counter() - step
+
+            step = time.perf_counter()
+            rows = []
+            for offset in range(channels):
+                channel_id = first_channel + offset
+                rows.append({'id': channel_id, 'name': f'{sentence(rng, 2).title()} {channel_id}',
+                             'description': sentence(rng, 8), 'owner_id': first_user + rng.randrange(users),
+                             'followers': 0, 'followers_offset': 0})
+                if len(rows) >= BATCH_SIZE:
+                    rows = insert_rows(conn, Channel.__table__, rows)
+            insert_rows(conn, Channel.__table__, rows)
+            timings['channels'] = time.perf_counter() - step
+
+            step = time.perf_counter()
+            now = datetime.utcnow()
+            rows = []
+            for offset in range(videos):
+                video_id = first_video + offset
+                rows.append({'id': video_id, 'title': f'{sentence(rng, 4).capitalize()} {video_id}',
+                             'description': sentence(rng, 20), 'filename': media_key,
+                             'upload_date': now - timedelta(seconds=rng.randrange(365 * 24 * 3600)),
+                             'uploader_id': first_user + rng.randrange(users),
+                             'channel_id': first_channel + skewed_index(rng, channels, 2), 'likes': 0, 'dislikes': 0})
+                if len(rows) >= BATCH_SIZE:
+                    rows = insert_rows(conn, Video.__table__, rows)
+            insert_rows(conn, Video.__table__, rows)
+            timings['videos'] = time.perf_counter() - step
+
+            # Follows y likes se generan por usuario y se insertan por lotes; los contadores se escriben al final
+            step = time.perf_counter()
+            channel_followers = [0] * channels
+            rows = []
+            for offset, count in enumerate(spread(follows, users, rng)):
+                for pick in distinct_picks(rng, count, channels, 3):
+                    channel_followers[pick] += 1
+                    rows.append({'user_id': first_user + offset, 'channel_id': first_channel + pick})
+                    if len(rows) >= BATCH_SIZE:
+                        rows = insert_rows(conn, Follow.__table__, rows)
+            insert_rows(conn, Follow.__table__, rows)
+            update_counters(conn, Channel, [{'row_id': first_channel + offset, 'followers': count}
+                                            for offset, count in enumerate(channel_followers) if count])
+            timings['follows'] = time.perf_counter() - step
+
+            step = time.perf_counter()
+            video_likes = [0] * videos
+            video_dislikes = [0] * videos
+            rows = []
+            for offset, count in enumerate(spread(likes, users, rng)):
+                for pick in distinct_picks(rng, count, videos, 2):
+                    reaction = 'like' if rng.random() < 0.85 else 'dislike'
+                    if reaction == 'like':
+                        video_likes[pick] += 1
+                    else:
+                        video_dislikes[pick] += 1
+                    rows.append({'user_id': first_user + offset, 'video_id': first_video + pick, 'type': reaction})
+                    if len(rows) >= BATCH_SIZE:
+                        rows = insert_rows(conn, Like.__table__, rows)
+            insert_rows(conn, Like.__table__, rows)
+            update_counters(conn, Video, [{'row_id': first_video + offset, 'likes': video_likes[offset], 'dislikes': video_dislikes[offset]}
+                                          for offset in range(videos) if video_likes[offset] or video_dislikes[offset]])
+            timings['likes'] = time.perf_counter() - step
+
+            step = time.perf_counter()
+            rows = []
+            for _ in range(comments):
+                rows.append({'content': sentence(rng, rng.randint(3, 25)), 'video_id': first_video + skewed_index(rng, videos, 2),
+                             'user_id': first_user + rng.randrange(users)})
+                if len(rows) >= BATCH_SIZE:
+                    rows = insert_rows(conn, Comment.__table__, rows)
+            insert_rows(conn, Comment.__table__, rows)
+            timings['comments'] = time.perf_counter() - step
+
+            step = time.perf_counter()
+            recompute_trending(conn)  # Recuenta comentarios y calcula el score de tendencias de todo el catálogo
+            timings['trending'] = time.perf_counter() - step
+
+            step = time.perf_counter()
+            backfill_timelines(conn)  # Timelines del feed a partir de los follows generados (canales pequeños)
+            timings['timelines'] = time.perf_counter() - step
+            recount_blobs(conn)  # Referencias del blob compartido
+
+        step = time.perf_counter()
+        if get_search_index().name == 'memory':
+            get_search_index().rebuild()  # FTS5 se mantiene con los triggers durante la carga
+        if db.engine.dialect.name == 'sqlite':
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql('ANALYZE')  # Estadísticas para el planificador con el volumen nuevo
+        timings['index'] = time.perf_counter() - step
+    timings = {name: round(seconds, 2) for name, seconds in timings.items()}
+    log(f'Datos generados en {time.perf_counter() - started:.1f} s: {timings}')
+    return {'first_user': first_user, 'first_channel': first_channel, 'first_video': first_video, 'timings': timings}
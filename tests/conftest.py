@@ -0,0 +1,29 @@
+# tests/conftest.py - La app lee DATABASE_URL y compañía al importarse: el entorno se fija antes del import
+import os
+import tempfile
+
+TEST_DIR = tempfile.mkdtemp(prefix='lyviontube-tests-')
+DATABASE_PATH = os.path.join(TEST_DIR, 'test.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DATABASE_PATH}'
+os.environ['JOB_WORKERS'] = '0'
+os.environ['METRICS_DIR'] = os.path.join(TEST_DIR, 'metrics')
+
+import pytest
+
+import LyvionTube
+from LyvionTube import app, db, fragment_cache, init_database
+
+@pytest.fixture
+def database(tmp_path):
+    # Base nueva con los datos de ejemplo y archivos en un directorio temporal; se borra al terminar
+    app.config['UPLOAD_FOLDER'] = str(tmp_path / 'uploads')
+    LyvionTube.storage = None
+    fragment_cache.clear()
+    with app.app_context():
+        init_database(seed_demo=True)
+        yield db
+        db.session.remove()
+        db.engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(DATABASE_PATH + suffix):
+            os.remove(DATABASE_PATH + suffix)
@@ -0,0 +1,10 @@
+# tests/test_admin.py - Ids de las acciones masivas: solo dígitos ASCII, el resto se ignora
+import io
+
+from LyvionTube import app, bulk_targets
+
+def test_bulk_targets_ignore_non_ascii_digits():
+    csv_file = (io.BytesIO('id,cantidad\n7,-3\n²,5\n8,¹\n'.encode()), 'ids.csv')
+    data = {'user_id': ['3', '²', '٤'], 'user_ids': '4, ³ 5;x', 'csv_file': csv_file}
+    with app.test_request_context(method='POST', data=data, content_type='multipart/form-data'):
+        assert bulk_targets('user_id') == ([3, 4, 5, 7, 8], {7: -3})
@@ -0,0 +1,95 @@
+# tests/test_cascade.py - Borrado en cascada y recolección de basura: filas dependientes y contadores
+from LyvionTube import (app, Blob, Channel, Comment, Follow, Like, User, Video, apply_comment_delta, apply_reaction_delta, attach_blob,
+                        collect_garbage, db, delete_objects, follow_channel, get_storage, refresh_trending_score,
+                        run_pending_jobs, store_file, trending_score)
+
+def add_user(username):
+    user = User(username=username, password='x')
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+def interact(user_id, video_id, channel_id):
+    db.session.add(Like(user_id=user_id, video_id=video_id, type='like'))
+    apply_reaction_delta(video_id, likes=1)
+    db.session.add(Comment(content='hola', user_id=user_id, video_id=video_id))
+    apply_comment_delta(video_id, 1)
+    follow_channel(user_id, channel_id)
+    db.session.commit()
+    refresh_trending_score(db.session.get(Video, video_id))
+    db.session.commit()
+
+def assert_counters(video_id, channel_id, likes, comments, followers):
+    db.session.expire_all()
+    video = db.session.get(Video, video_id)
+    assert (video.likes, video.comments_count) == (likes, comments)
+    assert video.trending_score == trending_score(video.likes, video.dislikes, video.comments_count, video.upload_date)
+    assert db.session.get(Channel, channel_id).followers == followers
+
+def test_delete_user_cascades_and_discounts(database):
+    video = Video.query.first()
+    video_id, channel_id = video.id, video.channel_id
+    followers = video.channel.followers
+    kept, deleted = add_user('kept'), add_user('deleted')
+    interact(kept, video_id, channel_id)
+    interact(deleted, video_id, channel_id)
+    assert_counters(video_id, channel_id, 2, 2, followers + 2)
+    assert delete_objects(users=[deleted]) == {'users': 1, 'channels': 0, 'videos': 0}
+    db.session.commit()
+    run_pending_jobs()
+    for model in (Like, Comment, Follow):
+        assert model.query.filter_by(user_id=deleted).count() == 0
+        assert model.query.filter_by(user_id=kept).count() == 1
+    assert_counters(video_id, channel_id, 1, 1, followers + 1)
+
+def test_delete_video_releases_blob_and_dependents(database):
+    video = Video.query.first()
+    video_id, channel_id = video.id, video.channel_id
+    interact(add_user('fan'), video_id, channel_id)
+    tmp_path = get_storage().temp_path()
+    with open(tmp_path, 'wb') as f:
+        f.write(b'video')
+    key, size = store_file(tmp_path, 'video.mp4')
+    attach_blob(key, size)
+    Video.query.filter_by(id=video_id).update({Video.filename: key})
+    db.session.commit()
+    delete_objects(videos=[video_id])
+    db.session.commit()
+    run_pending_jobs()
+    assert db.session.get(Video, video_id) is None
+    assert Like.query.filter_by(video_id=video_id).count() == 0
+    assert Comment.query.filter_by(video_id=video_id).count() == 0
+    blob = Blob.query.filter_by(key=key).one()
+    assert blob.refcount == 0 and blob.released_at is not None
+
+def test_garbage_collection_removes_orphans(database):
+    video = Video.query.first()
+    video_id, channel_id = video.id, video.channel_id
+    followers = video.channel.followers
+    orphan = add_user('orphan')
+    interact(orphan, video_id, channel_id)
+    # Borrado que se saltó la cascada (p. ej. un proceso que murió a mitad)
+    User.query.filter_by(id=orphan).delete(synchronize_session=False)
+    db.session.commit()
+    report = collect_garbage()
+    assert (report['likes'], report['comments'], report['follows']) == (1, 1, 1)
+    assert_counters(video_id, channel_id, 0, 0, followers)
+
+def rendered_comments(client, video_id):
+    return client.get(f'/video/{video_id}').data.count(b'<li class="p-4 bg-sky-50 rounded-lg hover-float" data-comment-id=')
+
+def test_comments_of_deleted_user_hidden_before_cascade(database):
+    video = Video.query.first()
+    video_id, channel_id = video.id, video.channel_id
+    kept, deleted = add_user('kept'), add_user('deleted')
+    interact(kept, video_id, channel_id)
+    interact(deleted, video_id, channel_id)
+    client = app.test_client()
+    assert rendered_comments(client, video_id) == 2  # Queda en la caché de fragmentos
+    delete_objects(users=[deleted])
+    db.session.commit()
+    response = client.get(f'/api/video/{video_id}/comments')
+    assert response.status_code == 200
+    assert [comment['user_id'] for comment in response.json['comments']] == [kept]
+    run_pending_jobs()
+    assert rendered_comments(client, video_id) == 1
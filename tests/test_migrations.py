@@ -0,0 +1,34 @@
+# tests/test_migrations.py - Ida y vuelta de todas las migraciones sobre una base con datos
+from sqlalchemy import inspect
+
+from LyvionTube import MIGRATIONS, Video, applied_migrations, db, migrate_down, migrate_up
+
+def schema():
+    inspector = inspect(db.engine)
+    return {table: ({column['name'] for column in inspector.get_columns(table)},
+                    {index['name'] for index in inspector.get_indexes(table)})
+            for table in inspector.get_table_names()}
+
+def videos():
+    return sorted(db.session.query(Video.id, Video.title, Video.likes, Video.dislikes, Video.comments_count).all())
+
+def test_new_database_is_stamped(database):
+    assert sorted(applied_migrations()) == [version for version, _, _, _ in MIGRATIONS]
+    assert migrate_up() == []
+
+def test_migrations_round_trip(database):
+    before_schema, before_videos = schema(), videos()
+    undone = migrate_down(0)
+    assert [version for version, _ in undone] == sorted((version for version, _, _, _ in MIGRATIONS), reverse=True)
+    assert applied_migrations() == {}
+    db.session.expire_all()
+    done = migrate_up()
+    assert [version for version, _ in done] == [version for version, _, _, _ in MIGRATIONS]
+    assert schema() == before_schema
+    assert videos() == before_videos
+
+def test_partial_down_and_up(database):
+    last = MIGRATIONS[-1][0]
+    assert [version for version, _ in migrate_down(last - 2)] == [last, last - 1]
+    assert sorted(applied_migrations()) == [version for version, _, _, _ in MIGRATIONS if version <= last - 2]
+    assert [version for version, _ in migrate_up()] == [last - 1, last]
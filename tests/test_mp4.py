@@ -0,0 +1,85 @@
+# tests/test_mp4.py - faststart y metadatos sobre un MP4 mínimo construido a mano (ftyp, mdat, moov al final)
+import struct
+
+from LyvionTube import mp4_faststart, read_mp4_metadata, read_top_level_boxes, shift_chunk_offsets
+
+CHUNKS = (b'first-chunk-data', b'second-chunk-data')
+
+def box(box_type, body):
+    return struct.pack('>I4s', 8 + len(body), box_type) + body
+
+def chunk_table(box_type, offsets):
+    fmt = '>I' if box_type == b'stco' else '>Q'
+    return box(box_type, b'\0\0\0\0' + struct.pack('>I', len(offsets)) + b''.join(struct.pack(fmt, offset) for offset in offsets))
+
+def moov(offsets, table=b'stco'):
+    mvhd = box(b'mvhd', b'\0\0\0\0' + struct.pack('>IIII', 0, 0, 1000, 12500) + b'\0' * 80)
+    tkhd = box(b'tkhd', b'\0' * 76 + struct.pack('>II', 1280 << 16, 720 << 16))
+    stbl = box(b'stbl', chunk_table(table, offsets))
+    return box(b'moov', mvhd + box(b'trak', tkhd + box(b'mdia', box(b'minf', stbl))))
+
+def build_mp4(table=b'stco'):
+    ftyp = box(b'ftyp', b'isom\0\0\0\0isom')
+    mdat = box(b'mdat', b''.join(CHUNKS))
+    first = len(ftyp) + 8
+    return ftyp + mdat + moov([first, first + len(CHUNKS[0])], table)
+
+def chunk_offsets(data):
+    for table, fmt, width in ((b'stco', '>I', 4), (b'co64', '>Q', 8)):
+        position = data.find(table)
+        if position != -1:
+            count = struct.unpack_from('>I', data, position + 8)[0]
+            return [struct.unpack_from(fmt, data, position + 12 + i * width)[0] for i in range(count)]
+    return []
+
+def box_order(path):
+    with open(path, 'rb') as f:
+        boxes, _ = read_top_level_boxes(f)
+    return [box_type for box_type, _, _ in boxes]
+
+def test_faststart_moves_moov_and_shifts_chunk_offsets(tmp_path):
+    source = tmp_path / 'video.mp4'
+    source.write_bytes(build_mp4())
+    output = tmp_path / 'faststart.mp4'
+    assert mp4_faststart(str(source), str(output))
+    assert box_order(str(output)) == [b'ftyp', b'moov', b'mdat']
+    data = output.read_bytes()
+    assert len(data) == source.stat().st_size
+    for offset, chunk in zip(chunk_offsets(data), CHUNKS):
+        assert data[offset:offset + len(chunk)] == chunk
+
+def test_faststart_in_place_and_idempotent(tmp_path):
+    source = tmp_path / 'video.mp4'
+    source.write_bytes(build_mp4())
+    expected = tmp_path / 'expected.mp4'
+    mp4_faststart(str(source), str(expected))
+    assert mp4_faststart(str(source))
+    assert source.read_bytes() == expected.read_bytes()
+    assert not mp4_faststart(str(source))  # moov ya está delante de mdat
+    assert not (tmp_path / 'video.mp4.faststart').exists()
+
+def test_faststart_with_co64(tmp_path):
+    source = tmp_path / 'video.mp4'
+    source.write_bytes(build_mp4(b'co64'))
+    assert mp4_faststart(str(source))
+    data = source.read_bytes()
+    for offset, chunk in zip(chunk_offsets(data), CHUNKS):
+        assert data[offset:offset + len(chunk)] == chunk
+
+def test_shift_chunk_offsets_only_touches_range():
+    patched = shift_chunk_offsets(moov([10, 100, 500]), 50, 100, 500)
+    assert chunk_offsets(patched) == [10, 150, 500]
+
+def test_metadata_before_and_after_faststart(tmp_path):
+    source = tmp_path / 'video.mp4'
+    source.write_bytes(build_mp4())
+    expected = {'duration': 12.5, 'width': 1280, 'height': 720}
+    assert read_mp4_metadata(str(source)) == expected
+    mp4_faststart(str(source))
+    assert read_mp4_metadata(str(source)) == expected
+
+def test_metadata_without_moov(tmp_path):
+    source = tmp_path / 'audio.mp4'
+    source.write_bytes(box(b'ftyp', b'isom\0\0\0\0isom') + box(b'mdat', b'data'))
+    assert read_mp4_metadata(str(source)) == {}
+    assert not mp4_faststart(str(source))
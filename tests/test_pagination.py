@@ -0,0 +1,28 @@
+# tests/test_pagination.py - Cursores manipulados: se ignoran en lugar de fallar
+import base64
+import json
+
+import pytest
+
+from LyvionTube import Video, app, decode_cursor, encode_cursor
+
+def cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+BAD_CURSORS = [cursor({'a': 1}), cursor({'0': 1, '1': 2}), cursor('texto'), cursor(7), cursor(None), cursor([]),
+               cursor([1, 2, 3]), cursor([[1], {}]), '%%%', 'eyJhIjogMX0=']
+
+def test_decode_cursor_checks_shape():
+    assert decode_cursor(encode_cursor(5)) == [5]
+    assert decode_cursor(encode_cursor('2025-01-01T00:00:00', 3), 2) == ['2025-01-01T00:00:00', 3]
+    assert decode_cursor(encode_cursor(5), 2) is None
+    for bad in BAD_CURSORS:
+        assert decode_cursor(bad) is None
+
+@pytest.mark.parametrize('bad', BAD_CURSORS)
+def test_listings_ignore_bad_cursors(database, bad):
+    video_id = Video.query.first().id
+    client = app.test_client()
+    for url in ('/?cursor={}', '/api/videos?cursor={}', '/api/videos?sort=trending&cursor={}',
+                f'/api/video/{video_id}/comments?cursor={{}}', '/search?q=video&cursor={}', '/feed?cursor={}'):
+        assert client.get(url.format(bad)).status_code in (200, 302), url
@@ -0,0 +1,19 @@
+# tests/test_search.py - El índice en memoria se reconstruye para ver lo escrito por otros procesos
+import LyvionTube
+from LyvionTube import MemorySearchIndex, Video, app, db, search_objects
+
+def titles(query):
+    return [video.title for video in search_objects('video', query, limit=10)[0]]
+
+def test_memory_index_rebuilds_after_ttl(database, monkeypatch):
+    monkeypatch.setattr(LyvionTube, 'search_index', MemorySearchIndex())
+    monkeypatch.setitem(app.config, 'SEARCH_INDEX_TTL', 300)
+    video = Video.query.first()
+    assert titles('zanahoria') == []
+    # Insert de otro proceso: no pasa por los eventos que actualizan el índice de este
+    with db.engine.begin() as conn:
+        conn.execute(Video.__table__.insert().values(title='Zanahoria gigante', description='', filename='x.mp4',
+                                                     uploader_id=video.uploader_id, channel_id=video.channel_id))
+    assert titles('zanahoria') == []
+    monkeypatch.setitem(app.config, 'SEARCH_INDEX_TTL', 0)
+    assert titles('zanahoria') == ['Zanahoria gigante']
@@ -0,0 +1,60 @@
+# tests/test_uploads.py - Subidas por partes: cuerpos no válidos y finalize que se puede reintentar
+import hashlib
+import os
+
+import pytest
+
+from LyvionTube import Blob, Channel, Video, app, db, get_storage, partial_upload_dir
+
+DATA = b'\0\0\0\x18ftypisom' + b'video' * 100
+
+def login(client):
+    channel = Channel.query.first()
+    with client.session_transaction() as session:
+        session['user_id'] = channel.owner_id
+    return channel.id
+
+def upload(client, channel_id):
+    response = client.post('/upload/sessions', json={'kind': 'video', 'filename': 'clip.mp4', 'size': len(DATA),
+                                                     'channel_id': channel_id, 'title': 'Clip'})
+    assert response.status_code == 201
+    upload_id = response.json['upload_id']
+    assert client.put(f'/upload/sessions/{upload_id}', data=DATA, headers={'Upload-Offset': '0'}).status_code == 200
+    return upload_id
+
+@pytest.mark.parametrize('body', [[1, 2], 'video', 3, {'kind': 'video', 'filename': ['clip.mp4']}])
+def test_create_rejects_non_object_json(database, body):
+    client = app.test_client()
+    login(client)
+    assert client.post('/upload/sessions', json=body).status_code == 400
+
+def test_finalize_rejects_non_object_json(database):
+    client = app.test_client()
+    upload_id = upload(client, login(client))
+    assert client.post(f'/upload/sessions/{upload_id}/finalize', json=['x']).status_code == 400
+    assert client.get(f'/upload/sessions/{upload_id}').json['offset'] == len(DATA)
+
+def test_finalize_retry_after_failed_commit(database, monkeypatch):
+    client = app.test_client()
+    upload_id = upload(client, login(client))
+    videos = Video.query.count()
+    commit = db.session.commit
+
+    def failing_commit():
+        raise RuntimeError('base caída')
+    monkeypatch.setattr(db.session, 'commit', failing_commit)
+    assert client.post(f'/upload/sessions/{upload_id}/finalize').status_code == 500
+    monkeypatch.setattr(db.session, 'commit', commit)
+    db.session.rollback()
+    # La sesión sigue completa y el reintento crea el video
+    assert client.get(f'/upload/sessions/{upload_id}').json['offset'] == len(DATA)
+    sha256 = hashlib.sha256(DATA).hexdigest()
+    response = client.post(f'/upload/sessions/{upload_id}/finalize', json={'sha256': sha256})
+    assert response.status_code == 201
+    assert Video.query.count() == videos + 1
+    key = db.session.get(Video, response.json['video_id']).filename
+    assert Blob.query.filter_by(key=key).one().refcount == 1
+    with open(get_storage().path(key), 'rb') as f:
+        assert f.read() == DATA
+    assert not os.path.exists(os.path.join(partial_upload_dir(), upload_id + '.part'))
+    assert client.post(f'/upload/sessions/{upload_id}/finalize').json == response.json